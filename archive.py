@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+Rétention et archivage des messages froids.
+
+Les messages plus vieux que la politique "hot" de leur conversation quittent MyData1.db
+et sont rangés, par blocs compressés (zlib), dans des bases d'archive mensuelles :
+archive/MyData1-AAAA-MM.db. Les lectures d'historique passent par read_group / read_dms
+qui relisent les blocs de façon transparente ; les messages au-delà de keep_days sont supprimés.
+
+Limite connue : un changement de nom ne réécrit pas les blocs déjà archivés.
+"""
+import json
+import os
+import sqlite3
+import time
+import zlib
+
+ARCHIVE_DIRNAME = "archive"
+DEFAULT_HOT_DAYS = 30.0      # au-delà : déplacé vers l'archive
+DEFAULT_KEEP_DAYS = None     # au-delà : supprimé (None = conservé indéfiniment)
+BLOCK_SIZE = 500             # messages par bloc compressé
+VACUUM_PAGES = 2000          # pages rendues au FS par passe d'incremental_vacuum
+
+DAY = 86400.0
+
+# ---------- Schéma ----------
+def _connect(db: str) -> sqlite3.Connection:
+    """db : chemin ou URI "file:" (base en mémoire d'un serveur embarqué)"""
+    return sqlite3.connect(db, uri=db.startswith("file:"))
+
+def init_retention(db: str):
+    """tables de politique / état + index sur ts (après migrate_add_ts_columns du serveur)"""
+    with _connect(db) as conn:
+        cur = conn.cursor()
+        _init_retention(cur)
+        _index_group_partitions(db, cur)
+        conn.commit()
+
+def _init_retention(cur):
+    # scope: 'group' (key = gid) | 'dm' (key = "nomA|nomB" trié) | 'default' (key = '*')
+    cur.execute("""CREATE TABLE IF NOT EXISTS retention(
+        scope TEXT,
+        key TEXT,
+        hot_days REAL,
+        keep_days REAL,
+        PRIMARY KEY(scope, key)
+    )""")
+    # plus grand id archivé par table ("group", "dm") et par groupe ("group:<gid>") :
+    # évite d'ouvrir l'archive pour les lectures récentes et pour les groupes jamais archivés
+    cur.execute("""CREATE TABLE IF NOT EXISTS archive_state(
+        kind TEXT PRIMARY KEY,
+        max_id INTEGER
+    )""")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_messages_ts ON messages(ts)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_group_messages_ts ON group_messages(ts)")
+
+def enable_incremental_vacuum(db: str):
+    """
+    Passe la base en auto_vacuum=INCREMENTAL. Sur une base existante, le mode
+    ne prend effet qu'après un VACUUM complet : fait une seule fois.
+    """
+    with _connect(db) as conn:
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if mode != 2:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.commit()
+            conn.execute("VACUUM")
+
+def dm_key(a: str, b: str) -> str:
+    return "|".join(sorted((a, b)))
+
+def set_policy(db: str, scope: str, key: str, hot_days: float, keep_days=None):
+    with _connect(db) as conn:
+        conn.execute("INSERT OR REPLACE INTO retention(scope, key, hot_days, keep_days) VALUES(?,?,?,?)",
+                     (scope, key, hot_days, keep_days))
+        conn.commit()
+
+def _load_policies(cur) -> tuple[dict, tuple]:
+    cur.execute("SELECT scope, key, hot_days, keep_days FROM retention")
+    policies = {(s, k): (h, kp) for s, k, h, kp in cur.fetchall()}
+    default = policies.pop(("default", "*"), (DEFAULT_HOT_DAYS, DEFAULT_KEEP_DAYS))
+    return policies, default
+
+# ---------- Partitions ----------
+def archive_dir(db: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(db)), ARCHIVE_DIRNAME)
+
+def _partition_path(db: str, ts: float) -> str:
+    base = os.path.splitext(os.path.basename(db))[0]
+    month = time.strftime("%Y-%m", time.gmtime(ts or 0))
+    return os.path.join(archive_dir(db), f"{base}-{month}.db")
+
+def _partitions(db: str) -> list[str]:
+    """fichiers d'archive du plus ancien au plus récent (le nom AAAA-MM trie chronologiquement)"""
+    d = archive_dir(db)
+    if not os.path.isdir(d):
+        return []
+    base = os.path.splitext(os.path.basename(db))[0] + "-"
+    return [os.path.join(d, f) for f in sorted(os.listdir(d)) if f.startswith(base) and f.endswith(".db")]
+
+def _open_partition(path: str) -> sqlite3.Connection:
+    new = not os.path.exists(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    if new:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS group_blocks(
+        group_id INTEGER,
+        first_id INTEGER,
+        last_id INTEGER,
+        last_ts REAL,
+        data BLOB,
+        PRIMARY KEY(group_id, first_id)
+    )""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS dm_blocks(
+        nomdestination TEXT,
+        first_id INTEGER,
+        last_id INTEGER,
+        last_ts REAL,
+        data BLOB,
+        nomemetteur TEXT,
+        PRIMARY KEY(nomdestination, first_id)
+    )""")
+    cols = [c[1] for c in conn.execute("PRAGMA table_info(dm_blocks)")]
+    if "nomemetteur" not in cols:
+        _migrate_dm_sender(conn)
+    return conn
+
+def _migrate_dm_sender(conn: sqlite3.Connection):
+    """
+    Partition d'avant la colonne nomemetteur : chaque bloc ne contient qu'une paire
+    (écrit par paire dans archive_cold), l'émetteur se relit dans le bloc.
+    """
+    conn.execute("ALTER TABLE dm_blocks ADD COLUMN nomemetteur TEXT")
+    rows = conn.execute("SELECT rowid, data FROM dm_blocks").fetchall()
+    conn.executemany("UPDATE dm_blocks SET nomemetteur=? WHERE rowid=?",
+                     [(_unpack(data)[0][1], rowid) for rowid, data in rows])
+    conn.commit()
+
+def _pack(rows: list) -> bytes:
+    return zlib.compress(json.dumps(rows, separators=(",", ":")).encode("utf-8"), 6)
+
+def _unpack(data: bytes) -> list:
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+# ---------- Lecture (read-through) ----------
+def _archived_max(cur, kind: str) -> int:
+    cur.execute("SELECT max_id FROM archive_state WHERE kind=?", (kind,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+def _index_group_partitions(db: str, cur):
+    """archive d'avant l'état par groupe : "group:<gid>" reconstruit depuis les partitions (une fois)"""
+    if not _archived_max(cur, "group"):
+        return
+    cur.execute("SELECT 1 FROM archive_state WHERE kind LIKE 'group:%' LIMIT 1")
+    if cur.fetchone():
+        return
+    for path in _partitions(db):
+        conn = _open_partition(path)
+        try:
+            rows = conn.execute("SELECT group_id, MAX(last_id) FROM group_blocks GROUP BY group_id").fetchall()
+        finally:
+            conn.close()
+        for gid, last in rows:
+            _bump_state(cur, f"group:{gid}", [last])
+
+def needs_archive(db: str, kind: str, after_id: int = 0) -> bool:
+    """vrai si des messages d'id > after_id peuvent se trouver dans l'archive"""
+    with _connect(db) as conn:
+        return _archived_max(conn.cursor(), kind) > after_id
+
+def read_group(db: str, gid: int, after_id: int = 0) -> list[tuple]:
+    """messages archivés du groupe : [(id, sender, message, ts), ...] triés"""
+    out = []
+    for path in _partitions(db):
+        with sqlite3.connect(path) as conn:
+            cur = conn.execute("""
+                SELECT data FROM group_blocks
+                WHERE group_id=? AND last_id > ?
+                ORDER BY first_id ASC
+            """, (gid, after_id))
+            for (data,) in cur.fetchall():
+                out.extend(tuple(r) for r in _unpack(data) if r[0] > after_id)
+    out.sort(key=lambda r: (r[-1], r[0]))
+    return out
+
+def read_group_page(db: str, gid: int, before: int, n: int) -> list[tuple]:
+    """
+    n derniers messages archivés du groupe d'id < before : [(id, sender, message, ts), ...] triés.
+    Partitions de la plus récente à la plus ancienne, blocs par id décroissant : arrêt dès que
+    n messages sont réunis (les ids croissent avec ts, donc avec le mois de partition).
+    """
+    chunks = []
+    got = 0
+    for path in reversed(_partitions(db)):
+        with sqlite3.connect(path) as conn:
+            cur = conn.execute("""
+                SELECT data FROM group_blocks
+                WHERE group_id=? AND first_id < ?
+                ORDER BY first_id DESC
+            """, (gid, before))
+            for (data,) in cur:
+                rows = [tuple(r) for r in _unpack(data) if r[0] < before]
+                chunks.append(rows)
+                got += len(rows)
+                if got >= n:
+                    break
+        if got >= n:
+            break
+    out = [r for rows in reversed(chunks) for r in rows]
+    return out[-n:] if n else []
+
+def read_dms(db: str, dest: str, after_id: int = 0) -> list[tuple]:
+    """DM archivés reçus par dest : [(id, emetteur, message, ts), ...] triés"""
+    out = []
+    for path in _partitions(db):
+        with sqlite3.connect(path) as conn:
+            cur = conn.execute("""
+                SELECT data FROM dm_blocks
+                WHERE nomdestination=? AND last_id > ?
+                ORDER BY first_id ASC
+            """, (dest, after_id))
+            for (data,) in cur.fetchall():
+                out.extend(tuple(r) for r in _unpack(data) if r[0] > after_id)
+    out.sort(key=lambda r: (r[-1], r[0]))
+    return out
+
+# ---------- Archivage ----------
+def _write_blocks(db: str, table: str, keys: dict, rows: list):
+    """rows: [(id, ..., ts)] -> blocs de BLOCK_SIZE (colonnes clés : keys) dans la partition du mois de chaque message"""
+    by_part = {}
+    for r in rows:
+        by_part.setdefault(_partition_path(db, r[-1]), []).append(r)
+    cols = ", ".join(keys)
+    marks = ",".join("?" * len(keys))
+    for path, prow in by_part.items():
+        conn = _open_partition(path)
+        try:
+            for i in range(0, len(prow), BLOCK_SIZE):
+                block = prow[i:i + BLOCK_SIZE]
+                # INSERT OR REPLACE : rejouer un lot après un crash reste idempotent
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {table}({cols}, first_id, last_id, last_ts, data) VALUES({marks},?,?,?,?)",
+                    (*keys.values(), block[0][0], block[-1][0], block[-1][-1], _pack(block)))
+            conn.commit()
+        finally:
+            conn.close()
+
+def _bump_state(cur, kind: str, ids: list[int]):
+    if ids:
+        cur.execute("""INSERT INTO archive_state(kind, max_id) VALUES(?, ?)
+                       ON CONFLICT(kind) DO UPDATE SET max_id = MAX(max_id, excluded.max_id)""",
+                    (kind, max(ids)))
+
+def _expire_partitions(db: str, policies: dict, default: tuple, now: float):
+    """supprime les blocs archivés au-delà de keep_days ; retire les partitions vides"""
+    for path in _partitions(db):
+        conn = _open_partition(path)
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT DISTINCT group_id FROM group_blocks")
+            for (gid,) in cur.fetchall():
+                keep = policies.get(("group", str(gid)), default)[1]
+                if keep is not None:
+                    cur.execute("DELETE FROM group_blocks WHERE group_id=? AND last_ts < ?", (gid, now - keep * DAY))
+            # DM : politique de la paire seulement (celle d'un participant ne touche pas aux autres paires)
+            cur.execute("SELECT DISTINCT nomemetteur, nomdestination FROM dm_blocks")
+            for em, dest in cur.fetchall():
+                keep = policies.get(("dm", dm_key(em, dest)), default)[1]
+                if keep is not None:
+                    cur.execute("DELETE FROM dm_blocks WHERE nomemetteur=? AND nomdestination=? AND last_ts < ?",
+                                (em, dest, now - keep * DAY))
+            conn.commit()
+            cur.execute("SELECT (SELECT COUNT(*) FROM group_blocks) + (SELECT COUNT(*) FROM dm_blocks)")
+            empty = cur.fetchone()[0] == 0
+            if not empty:
+                cur.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES})")
+                cur.fetchall()
+        finally:
+            conn.close()
+        if empty:
+            os.remove(path)
+
+def archive_cold(db: str, now: float | None = None) -> dict:
+    """
+    Une passe de rétention : supprime ce qui dépasse keep_days, déplace ce qui dépasse
+    hot_days vers l'archive, puis rend les pages libérées (incremental_vacuum).
+    Retourne {"group": n, "dm": n} messages archivés.
+    """
+    now = time.time() if now is None else now
+    moved = {"group": 0, "dm": 0}
+    with _connect(db) as conn:
+        cur = conn.cursor()
+        policies, default = _load_policies(cur)
+        min_hot = min([default[0]] + [p[0] for p in policies.values()])
+        oldest = now - min_hot * DAY
+
+        # --- groupes ---
+        cur.execute("SELECT DISTINCT group_id FROM group_messages WHERE ts < ?", (oldest,))
+        for (gid,) in cur.fetchall():
+            hot, keep = policies.get(("group", str(gid)), default)
+            if keep is not None:
+                cur.execute("DELETE FROM group_messages WHERE group_id=? AND ts < ?", (gid, now - keep * DAY))
+            cur.execute("""
+                SELECT rowid, sender, message, ts FROM group_messages
+                WHERE group_id=? AND ts < ? ORDER BY rowid ASC
+            """, (gid, now - hot * DAY))
+            rows = cur.fetchall()
+            if not rows:
+                continue
+            _write_blocks(db, "group_blocks", {"group_id": gid}, rows)
+            ids = [r[0] for r in rows]
+            cur.executemany("DELETE FROM group_messages WHERE rowid=?", [(i,) for i in ids])
+            _bump_state(cur, "group", ids)
+            _bump_state(cur, f"group:{gid}", ids)
+            conn.commit()
+            moved["group"] += len(rows)
+
+        # --- DM (politique par paire, blocs par paire, relus par destinataire) ---
+        cur.execute("SELECT DISTINCT nomemetteur, nomdestination FROM messages WHERE ts < ?", (oldest,))
+        for em, dest in cur.fetchall():
+            hot, keep = policies.get(("dm", dm_key(em, dest)), default)
+            if keep is not None:
+                cur.execute("DELETE FROM messages WHERE nomemetteur=? AND nomdestination=? AND ts < ?",
+                            (em, dest, now - keep * DAY))
+            cur.execute("""
+                SELECT rowid, nomemetteur, message, ts FROM messages
+                WHERE nomemetteur=? AND nomdestination=? AND ts < ? ORDER BY rowid ASC
+            """, (em, dest, now - hot * DAY))
+            rows = cur.fetchall()
+            if not rows:
+                continue
+            _write_blocks(db, "dm_blocks", {"nomdestination": dest, "nomemetteur": em}, rows)
+            ids = [r[0] for r in rows]
+            cur.executemany("DELETE FROM messages WHERE rowid=?", [(i,) for i in ids])
+            _bump_state(cur, "dm", ids)
+            conn.commit()
+            moved["dm"] += len(rows)
+
+        conn.commit()
+        cur.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES})")
+        cur.fetchall()
+
+    _expire_partitions(db, policies, default, now)
+    return moved
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Bench de diffusion groupe : CPU serveur par message livré.
+
+Lance server.py dans un dossier temporaire (base neuve), connecte N membres,
+crée un groupe avec tous, envoie M messages et mesure le temps CPU du processus
+serveur (/proc/<pid>/stat, Linux) rapporté au nombre de messages livrés.
+
+    python bench_fanout.py --members 500 --messages 200
+"""
+import argparse
+import os
+import selectors
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ENC = "utf-8"
+
+def _cpu_seconds(pid: int):
+    """utime + stime du processus (None hors Linux)"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except OSError:
+        return None
+
+def _read_line(sock: socket.socket, buf: bytearray) -> str:
+    while b"\n" not in buf:
+        data = sock.recv(4096)
+        if not data:
+            raise ConnectionError
+        buf += data
+    line, _, rest = bytes(buf).partition(b"\n")
+    buf[:] = rest
+    return line.decode(ENC)
+
+def _login(host: str, port: int, name: str) -> socket.socket:
+    s = socket.create_connection((host, port))
+    s.sendall(f"{name}/pw/{name}@bench/pw\n".encode(ENC))
+    buf = bytearray()
+    while not _read_line(s, buf).startswith("@groups/"):
+        pass
+    return s
+
+def _wait_port(host: str, port: int, timeout: float = 10.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        try:
+            socket.create_connection((host, port)).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("serveur injoignable")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--server", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py"))
+    ap.add_argument("--host", default=socket.gethostbyname(socket.gethostname()))
+    ap.add_argument("--port", type=int, default=12345)
+    ap.add_argument("--members", type=int, default=500)
+    ap.add_argument("--messages", type=int, default=200)
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_fanout_")
+    proc = subprocess.Popen([sys.executable, args.server, "--host", args.host, "--port", str(args.port)],
+                            cwd=workdir,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_port(args.host, args.port)
+        socks = [_login(args.host, args.port, f"u{i}") for i in range(args.members)]
+        names = ",".join(f'"u{i}"' for i in range(args.members))
+        socks[0].sendall(f"[{names}]@addgroup\n".encode(ENC))
+
+        # lecteurs : compter les messages de groupe reçus
+        received = 0
+        count_lock = threading.Lock()
+        stop = threading.Event()
+        sel = selectors.DefaultSelector()
+        for s in socks:
+            s.setblocking(False)
+            sel.register(s, selectors.EVENT_READ)
+
+        def reader():
+            nonlocal received
+            while not stop.is_set():
+                for key, _ in sel.select(0.1):
+                    try:
+                        data = key.fileobj.recv(65536)
+                    except BlockingIOError:
+                        continue
+                    n = data.count(b"/group\x1f")
+                    if n:
+                        with count_lock:
+                            received += n
+        threading.Thread(target=reader, daemon=True).start()
+
+        # attendre la fin des paquets de création du groupe
+        expected_setup = args.members
+        end = time.monotonic() + 30
+        while received < expected_setup and time.monotonic() < end:
+            time.sleep(0.05)
+        with count_lock:
+            received = 0
+
+        expected = args.messages * args.members
+        cpu0, t0 = _cpu_seconds(proc.pid), time.perf_counter()
+        sender = socks[0]
+        for i in range(args.messages):
+            payload = f"@g/1/message {i} " + "x" * 64 + "\n"
+            view = memoryview(payload.encode(ENC))
+            while view:
+                try:
+                    view = view[sender.send(view):]
+                except BlockingIOError:
+                    time.sleep(0.001)
+        end = time.monotonic() + 120
+        while received < expected and time.monotonic() < end:
+            time.sleep(0.01)
+        wall = time.perf_counter() - t0
+        cpu1 = _cpu_seconds(proc.pid)
+        stop.set()
+
+        print(f"membres={args.members} messages={args.messages} livrés={received}/{expected}")
+        print(f"mur: {wall:.3f} s  ({received / wall:,.0f} livraisons/s)")
+        if cpu0 is not None and received:
+            cpu = cpu1 - cpu0
+            print(f"CPU serveur: {cpu:.3f} s  ({cpu / received * 1e6:.2f} µs / message livré)")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+if __name__ == "__main__":
+    main()
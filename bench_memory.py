@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Bench mémoire : octets par connexion inactive et par appartenance à un groupe.
+
+Simule N utilisateurs connectés (sans vraies sockets : un objet témoin par connexion, alloué
+avant la mesure) avec les fonctions d'état du serveur (server._add_session, _cache_group,
+_attach_groups), et la représentation précédente (listes alignées, dicts de dicts, ensembles
+de noms) pour comparaison. Mesure tracemalloc : état de routage seul, hors socket et noyau.
+Le coût d'un thread de session (RSS / virtuel, Linux) est mesuré à part, pile par défaut
+(et --stack Kio pour comparaison ; server.THREAD_STACK reste au défaut, voir server.py).
+
+    python bench_memory.py --users 10000 50000 100000 --groups-per-user 5 --group-size 50
+"""
+import argparse
+import gc
+import threading
+import time
+import tracemalloc
+
+import server
+
+# ---------- Représentation précédente (référence) ----------
+class _Legacy:
+    def __init__(self):
+        self.clients, self.names = [], []
+        self.sock_by_name, self.last_seen = {}, {}
+        self.groups, self.user_groups, self.group_online, self.current_group_by_user = {}, {}, {}, {}
+
+    def connect(self, sock, nom: str):
+        self.clients.append(sock)
+        self.names.append(nom)
+        self.sock_by_name[nom] = sock
+        self.last_seen[sock] = time.monotonic()
+
+    def cache_group(self, gid: int, admin: str, members: list[str]):
+        self.groups[gid] = {"admin": admin, "members": set(members)}
+
+    def attach_groups(self, sock, nom: str, gids: list[int]):
+        self.user_groups[nom] = set(gids)
+        for gid in gids:
+            self.group_online.setdefault(gid, set()).add(sock)
+        if gids:
+            self.current_group_by_user[nom] = gids[-1]
+
+class _Current:
+    def __init__(self):
+        server._reset_state()
+
+    def connect(self, sock, nom: str):
+        server._add_session(sock, nom)
+
+    def cache_group(self, gid: int, admin: str, members: list[str]):
+        server._cache_group(gid, admin, members)
+
+    def attach_groups(self, sock, nom: str, gids: list[int]):
+        server._attach_groups(server.sessions[sock], gids)
+
+# ---------- Mesure ----------
+def _fresh(name: str) -> str:
+    """nouvelle chaîne (comme lue sur une socket ou dans une ligne SQLite)"""
+    return (name + ".")[:-1]
+
+def measure(kind, n: int, per_user: int, group_size: int) -> tuple[float, float]:
+    """(octets par connexion, octets par appartenance) pour n utilisateurs"""
+    socks = [object() for _ in range(n)]
+    users = [f"user{i:06d}" for i in range(n)]
+    n_groups = max(1, n * per_user // group_size)
+    gids_of = [[(i * per_user + j) % n_groups + 1 for j in range(per_user)] for i in range(n)]
+    members_of = {}
+    for i, gids in enumerate(gids_of):
+        for gid in gids:
+            members_of.setdefault(gid, []).append(users[i])
+    gc.collect()
+    tracemalloc.start()
+    state = kind()                       # l'état vide compte dans la base
+    base = tracemalloc.get_traced_memory()[0]
+    for sock, nom in zip(socks, users):
+        state.connect(sock, _fresh(nom))
+    gc.collect()
+    connected = tracemalloc.get_traced_memory()[0]
+    # registre entièrement chargé (pire cas) + index de diffusion des sessions
+    for gid, members in members_of.items():
+        state.cache_group(gid, _fresh(members[0]), [_fresh(m) for m in members])
+    for sock, nom, gids in zip(socks, users, gids_of):
+        state.attach_groups(sock, nom, gids)
+    gc.collect()
+    joined = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    memberships = sum(len(g) for g in gids_of)
+    del state
+    server._reset_state()
+    return (connected - base) / n, (joined - connected) / memberships
+
+def _proc_kib(field: str) -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+def thread_cost(n: int, stack: int) -> tuple[float, float] | None:
+    """(RSS Kio, virtuel Kio) par thread inactif ; None hors Linux"""
+    try:
+        _proc_kib("VmRSS")
+    except OSError:
+        return None
+    old = threading.stack_size(stack)
+    stop = threading.Event()
+    try:
+        rss0, vm0 = _proc_kib("VmRSS"), _proc_kib("VmSize")
+        threads = [threading.Thread(target=stop.wait, daemon=True) for _ in range(n)]
+        for t in threads:
+            t.start()
+        rss1, vm1 = _proc_kib("VmRSS"), _proc_kib("VmSize")
+    finally:
+        stop.set()
+        threading.stack_size(old)
+    for t in threads:
+        t.join()
+    return (rss1 - rss0) / n, (vm1 - vm0) / n
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, nargs="+", default=[10000, 50000, 100000])
+    ap.add_argument("--groups-per-user", type=int, default=5)
+    ap.add_argument("--group-size", type=int, default=50)
+    ap.add_argument("--threads", type=int, default=1000, help="threads inactifs pour la mesure de pile")
+    ap.add_argument("--stack", type=int, help="pile à comparer au défaut (Kio)")
+    args = ap.parse_args()
+
+    k = args.groups_per_user
+    print(f"{'utilisateurs':>12}{'o/connexion avant':>20}{'après':>9}{'o/appartenance avant':>23}{'après':>9}"
+          f"{f'o/utilisateur ({k} groupes) avant':>34}{'après':>9}")
+    for n in args.users:
+        conn_old, memb_old = measure(_Legacy, n, k, args.group_size)
+        conn_new, memb_new = measure(_Current, n, k, args.group_size)
+        print(f"{n:>12,}{conn_old:>20.0f}{conn_new:>9.0f}{memb_old:>23.1f}{memb_new:>9.1f}"
+              f"{conn_old + k * memb_old:>34.0f}{conn_new + k * memb_new:>9.0f}")
+
+    print(f"\nthread de session ({args.threads} threads inactifs) :")
+    stacks = [("pile par défaut", 0)] + ([(f"pile {args.stack} Kio", args.stack * 1024)] if args.stack else [])
+    for label, stack in stacks:
+        cost = thread_cost(args.threads, stack)
+        if cost is None:
+            print("  mesure indisponible (Linux seulement)")
+            break
+        print(f"  {label:<18} RSS {cost[0]:6.1f} Kio, virtuel {cost[1]:8.1f} Kio")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Bench TLS : coût du handshake (complet vs repris) et débit en régime établi vs texte clair.
+
+Génère une CA de test locale (tls.make_test_ca, outil openssl requis), lance deux serveurs
+d'écho ligne par ligne en local (clair / TLS, mêmes contextes que server.py) et mesure :
+  - la durée moyenne d'un handshake complet puis d'un handshake repris (ticket de session),
+  - le débit de paquets de chat (aller-retour en pipeline) en clair et sous TLS.
+
+    python bench_tls.py --handshakes 200 --packets 50000
+"""
+import argparse
+import socket
+import ssl
+import tempfile
+import threading
+import time
+
+import tls
+
+def _echo(conn: socket.socket):
+    try:
+        while True:
+            data = conn.recv(65536)
+            if not data:
+                break
+            conn.sendall(data)
+    except OSError:
+        pass
+    finally:
+        conn.close()
+
+def _serve(ctx: ssl.SSLContext | None) -> int:
+    """serveur d'écho sur un port éphémère ; handshake dans le thread de la connexion"""
+    srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    srv.bind(("127.0.0.1", 0))
+    srv.listen(128)
+
+    def handle(conn):
+        if ctx is not None:
+            try:
+                conn = ctx.wrap_socket(conn, server_side=True)
+            except (OSError, ssl.SSLError):
+                conn.close()
+                return
+        _echo(conn)
+
+    def loop():
+        while True:
+            conn, _ = srv.accept()
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+    threading.Thread(target=loop, daemon=True).start()
+    return srv.getsockname()[1]
+
+def _connect(port: int, ctx: ssl.SSLContext | None, session=None) -> socket.socket:
+    s = socket.create_connection(("127.0.0.1", port))
+    s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if ctx is not None:
+        s = ctx.wrap_socket(s, server_hostname="127.0.0.1", session=session)
+    return s
+
+def _roundtrip(s: socket.socket):
+    s.sendall(b"@ping\n")
+    s.recv(64)
+
+def bench_handshakes(port: int, ctx: ssl.SSLContext, n: int) -> dict:
+    """durées moyennes (mur, et CPU client + serveur : même processus)"""
+    full = 0.0
+    cpu0 = time.process_time()
+    for _ in range(n):
+        t0 = time.perf_counter()
+        s = _connect(port, ctx)
+        full += time.perf_counter() - t0
+        s.close()
+    full_cpu = time.process_time() - cpu0
+
+    # obtenir un ticket : il arrive après le handshake (TLS 1.3), d'où l'aller-retour
+    s = _connect(port, ctx)
+    _roundtrip(s)
+    session = s.session
+    s.close()
+
+    resumed, reused = 0.0, 0
+    cpu0 = time.process_time()
+    for _ in range(n):
+        t0 = time.perf_counter()
+        s = _connect(port, ctx, session)
+        resumed += time.perf_counter() - t0
+        reused += s.session_reused
+        _roundtrip(s)
+        session = s.session
+        s.close()
+    # le CPU repris inclut l'aller-retour nécessaire pour recevoir le ticket suivant
+    resumed_cpu = time.process_time() - cpu0
+    return {"full": full / n, "full_cpu": full_cpu / n,
+            "resumed": resumed / n, "resumed_cpu": resumed_cpu / n, "reused": reused}
+
+def bench_throughput(port: int, ctx: ssl.SSLContext | None, packets: int, size: int) -> float:
+    s = _connect(port, ctx)
+    line = b"x" * (size - 1) + b"\n"
+    total = packets * len(line)
+
+    def writer():
+        for _ in range(packets):
+            s.sendall(line)
+    t0 = time.perf_counter()
+    threading.Thread(target=writer, daemon=True).start()
+    got = 0
+    while got < total:
+        data = s.recv(65536)
+        if not data:
+            break
+        got += len(data)
+    dt = time.perf_counter() - t0
+    s.close()
+    return packets / dt
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--handshakes", type=int, default=200)
+    ap.add_argument("--packets", type=int, default=50000)
+    ap.add_argument("--size", type=int, default=100, help="taille d'un paquet (octets)")
+    args = ap.parse_args()
+
+    paths = tls.make_test_ca(tempfile.mkdtemp(prefix="bench_tls_"))
+    server_ctx = tls.server_context(paths["cert"], paths["key"])
+    client_ctx = tls.client_context(paths["ca"])
+    plain_port = _serve(None)
+    tls_port = _serve(server_ctx)
+
+    h = bench_handshakes(tls_port, client_ctx, args.handshakes)
+    print(f"handshake complet : {h['full'] * 1e3:.3f} ms  (CPU {h['full_cpu'] * 1e3:.3f} ms)")
+    print(f"handshake repris  : {h['resumed'] * 1e3:.3f} ms  (CPU {h['resumed_cpu'] * 1e3:.3f} ms, "
+          f"repris {h['reused']}/{args.handshakes})")
+
+    plain = bench_throughput(plain_port, None, args.packets, args.size)
+    secure = bench_throughput(tls_port, client_ctx, args.packets, args.size)
+    print(f"débit clair : {plain:,.0f} paquets/s")
+    print(f"débit TLS   : {secure:,.0f} paquets/s  ({secure / plain:.0%} du clair)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Capture du trafic entrant du serveur, pour le rejouer (replay.py) sur une base neuve.
+
+Fichier binaire : en-tête MAGIC + version + mode, puis un enregistrement par paquet reçu :
+    RECORD (ts depuis le début de la capture, id de session, opcode, taille du paquet,
+            taille du contenu) + contenu utf-8 (vide en mode "none")
+Modes de contenu :
+    "none" : tailles seulement (replay synthétise des paquets de même taille)
+    "anon" : noms remplacés par des alias stables (HMAC, clé propre à la capture),
+             textes et mots de passe remplacés ; la structure du paquet est conservée
+    "raw"  : paquets tels quels (données réelles : ne pas sortir de la machine)
+Les sessions sont numérotées dans l'ordre des connexions ; "login" porte le nom authentifié
+(y compris après une reprise de session), "close" marque la déconnexion.
+Les gids sont ceux du serveur capturé : capturer depuis une base vide pour un rejeu fidèle.
+"""
+import hashlib
+import hmac
+import json
+import secrets
+import struct
+import threading
+import time
+
+MAGIC = b"ICAP"
+VERSION = 1
+MODES = ("none", "anon", "raw")
+HEADER = struct.Struct("<4sBB")          # magic, version, mode
+RECORD = struct.Struct("<dIBII")         # ts, session, opcode, taille, taille du contenu
+
+# opcode = index (ajouts en fin de liste) ; noms = server._command_name + authentification / fin de session
+OPCODES = ("login", "close", "ping", "pong", "g", "historique", "addmembers", "rename",
+           "addgroup", "addgroup_new", "list", "retention", "dm", "group_text", "read")
+_OP = {name: i for i, name in enumerate(OPCODES)}
+
+FLUSH_INTERVAL = 1.0         # s : au pire la dernière seconde est perdue si le serveur est tué
+
+ACTIVE = False
+
+_lock = threading.Lock()
+_file = None
+_mode = "none"
+_key = b""
+_t0 = 0.0
+_flushed = 0.0
+_sessions = {}               # socket -> id de session
+_next_id = 0
+
+# ---------- Anonymisation ----------
+def _alias(name: str) -> str:
+    return "u" + hmac.new(_key, name.encode("utf-8"), hashlib.blake2s).hexdigest()[:10]
+
+def _aliases(json_payload: str) -> str:
+    try:
+        return json.dumps([_alias(str(n)) for n in json.loads(json_payload)])
+    except Exception:
+        return "[]"
+
+def _conv(conv: str) -> str:
+    return "d:" + _alias(conv[2:]) if conv.startswith("d:") else conv
+
+def anonymise(op: str, raw: str) -> str:
+    """même forme que raw (gids, tailles, séparateurs), sans noms ni textes réels"""
+    if op == "login":
+        return _alias(raw)
+    if op == "g":
+        _, gid, text = raw.split("/", 2)
+        return f"@g/{gid}/" + "x" * len(text)
+    if op == "addmembers":
+        _, gid, members = raw.split("/", 2)
+        return f"@addmembers/{gid}/" + _aliases(members)
+    if op == "rename":
+        return _alias(raw.split("!", 1)[0]) + "!changerlenom"
+    if op == "addgroup":
+        return _aliases(raw[:-len("@addgroup")]) + "@addgroup"
+    if op == "addgroup_new":
+        return _aliases(raw[:-len("@addgroup@new")]) + "@addgroup@new"
+    if op == "retention":
+        _, conv, hot, keep = raw.split("/")
+        return f"@retention/{_conv(conv)}/{hot}/{keep}"
+    if op == "read":
+        _, conv, mid = raw.rsplit("/", 2)
+        return f"@read/{_conv(conv)}/{mid}"
+    if op == "dm":
+        msg, target = raw.split("/", 1)
+        return "x" * len(msg) + "/" + _alias(target)
+    if op == "group_text":
+        return "x" * len(raw)
+    return raw                  # ping, pong, historique, list : pas de donnée utilisateur
+
+# ---------- Enregistrement ----------
+def start(path: str, mode: str = "anon"):
+    global ACTIVE, _file, _mode, _key, _t0, _next_id
+    if mode not in MODES:
+        raise ValueError(f"mode de capture inconnu: {mode}")
+    with _lock:
+        if _file is not None:
+            _file.close()
+        _file = open(path, "wb")
+        _file.write(HEADER.pack(MAGIC, VERSION, MODES.index(mode)))
+        _mode = mode
+        _key = secrets.token_bytes(16)
+        _t0 = time.monotonic()
+        _sessions.clear()
+        _next_id = 0
+        ACTIVE = True
+
+def stop():
+    global ACTIVE, _file
+    with _lock:
+        ACTIVE = False
+        if _file is not None:
+            _file.close()
+            _file = None
+        _sessions.clear()
+
+def record(sock, op: str, raw: str):
+    """un paquet reçu sur sock (op : voir OPCODES) ; "close" oublie la session"""
+    global _next_id, _flushed
+    now = time.monotonic()
+    size = len(raw.encode("utf-8"))
+    if _mode == "none":
+        payload = b""
+    else:
+        try:
+            payload = (raw if _mode == "raw" else anonymise(op, raw)).encode("utf-8")
+        except ValueError:
+            payload = b""       # paquet mal formé : la taille suffit
+    with _lock:
+        if _file is None:
+            return
+        sid = _sessions.get(sock)
+        if sid is None:
+            sid = _sessions[sock] = _next_id
+            _next_id += 1
+        if op == "close":
+            del _sessions[sock]
+        _file.write(RECORD.pack(now - _t0, sid, _OP[op], size, len(payload)))
+        _file.write(payload)
+        if now - _flushed > FLUSH_INTERVAL:
+            _file.flush()
+            _flushed = now
+
+# ---------- Lecture ----------
+def read(path: str):
+    """
+    Renvoie (mode, enregistrements) ; chaque enregistrement est
+    (ts, session, op, taille, contenu | None).
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, mode = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path}: pas une capture v{VERSION}")
+    records = []
+    pos = HEADER.size
+    while pos + RECORD.size <= len(data):
+        ts, sid, op, size, plen = RECORD.unpack_from(data, pos)
+        pos += RECORD.size
+        if pos + plen > len(data):
+            break               # fin tronquée (serveur tué pendant la capture)
+        payload = data[pos:pos + plen].decode("utf-8") if plen else None
+        pos += plen
+        records.append((ts, sid, OPCODES[op], size, payload))
+    return MODES[mode], records
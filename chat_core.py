@@ -0,0 +1,589 @@
+# -*- coding: utf-8 -*-
+"""
+Cœur réseau du client, sans interface graphique (bots, outils en ligne de commande, tests de charge).
+
+    ChatClient  : socket, framing, heartbeat, reprise de session, fichiers.
+    ChatSession : authentification (sign in / sign up), boucle de réception et décodage
+                  des paquets en événements (kind, *args) remis à on_event, ou via aevents()
+                  pour asyncio.
+
+L'interface CustomTkinter (client_gui.py) n'est importée que par client.py.
+"""
+import hashlib
+import json
+import os
+import random
+import socket
+import ssl
+import threading
+import time
+
+FORMATT = "utf-8"
+
+# heartbeat : doit rester < HEARTBEAT_INTERVAL côté serveur
+PING_INTERVAL = 10.0
+SERVER_TIMEOUT = 45.0    # s sans aucun paquet reçu -> serveur considéré mort
+
+# reconnexion : backoff exponentiel avec jitter (évite la ruée après un redémarrage serveur)
+RECONNECT_BASE = 0.5
+RECONNECT_MAX = 30.0
+SEQ = "\x1f"            # séparateur du tag "conv/id" ajouté par le serveur
+
+GROUP_LINES_MAX = 1000   # lignes gardées par groupe pour le changement de groupe
+READ_ACK_DELAY = 2.0     # s : accusés de lecture regroupés avant envoi ("@read/")
+
+# fichiers : port dédié (SERVER_PORT + 1), voir filestore.py côté serveur
+FILE_CHUNK = 256 * 1024
+
+# ---------- Utilitaire ----------
+def _read_line(sock: socket.socket) -> str:
+    """ligne d'en-tête du serveur de fichiers (lue octet par octet, les données suivent)"""
+    out = bytearray()
+    while not out.endswith(b"\n"):
+        b = sock.recv(1)
+        if not b:
+            raise ConnectionError("connexion fermée par le serveur")
+        out += b
+    return out[:-1].decode("ascii")
+
+# ---------- Client réseau ----------
+class ChatClient:
+    def __init__(self, host: str, port: int, tls_context: ssl.SSLContext | None = None,
+                 file_port: int | None = None):
+        self.host = host
+        self.port = port
+        self.file_port = file_port or port + 1   # serveur embarqué : port de fichiers éphémère
+        # TLS optionnel ; la session est gardée pour un handshake abrégé à la reconnexion
+        self.tls_context = tls_context
+        self.tls_session = None
+        self._tls_fresh = False         # ticket pas encore relu sur la connexion courante
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._rx = bytearray()
+        self.last_rx = time.monotonic()
+        # envois depuis plusieurs threads (UI, heartbeat, accusés de lecture, réponse aux "@ping")
+        self.send_lock = threading.Lock()
+        self._hb_stop = threading.Event()
+        # reprise de session
+        self.token = None
+        self.floor = {"d": 0, "g": 0}   # ids max au login
+        self.last_seen = {}             # "d:<nom>" / "g:<gid>" -> dernier id reçu
+        self.current_gid = None
+        self.conv = None                # conversation ("g:<gid>" / "d:<nom>") du dernier paquet
+        self.connect()
+
+    def _wrap(self, sock: socket.socket) -> socket.socket:
+        if self.tls_context is None:
+            return sock
+        return self.tls_context.wrap_socket(sock, server_hostname=self.host, session=self.tls_session)
+
+    def _keep_tls_session(self, sock):
+        # ticket TLS 1.3 reçu après le handshake : à relire avant de jeter la socket
+        if isinstance(sock, ssl.SSLSocket) and sock.session is not None:
+            self.tls_session = sock.session
+
+    def connect(self):
+        self._keep_tls_session(self.sock)
+        try:
+            self.sock.close()
+        except Exception:
+            pass
+        sock = socket.create_connection((self.host, self.port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = self._wrap(sock)
+        self._tls_fresh = self.tls_context is not None
+        self._rx.clear()
+        self.last_rx = time.monotonic()
+
+    def send(self, text: str):
+        # un paquet = une ligne ; un seul sendall à la fois (TLS : pas d'SSL_write concurrents)
+        data = (text + "\n").encode(FORMATT)
+        with self.send_lock:
+            self.sock.sendall(data)
+
+    def recv(self, size: int = 4096) -> str:
+        """renvoie le prochain paquet complet (sans le '\n' final ni le tag d'id)"""
+        while True:
+            while b"\n" not in self._rx:
+                data = self.sock.recv(size)
+                if not data:
+                    raise ConnectionError("connexion fermée par le serveur")
+                self._rx += data
+            self.last_rx = time.monotonic()
+            if self._tls_fresh:
+                # le ticket arrive avec les premières données du serveur
+                self._keep_tls_session(self.sock)
+                self._tls_fresh = False
+            line, _, rest = bytes(self._rx).partition(b"\n")
+            self._rx[:] = rest
+            raw = line.decode(FORMATT)
+            if raw.startswith("@session/"):
+                # "@session/token/dm_max/grp_max" : consommé ici, invisible pour l'UI
+                _, self.token, dm_max, grp_max = raw.split("/")
+                self.floor = {"d": int(dm_max), "g": int(grp_max)}
+                self.last_seen.clear()
+                continue
+            return self._note_seen(raw)
+
+    def _note_seen(self, raw: str) -> str:
+        """retire le tag "\x1fconv\x1fid" et mémorise le dernier id vu par conversation"""
+        self.conv = None
+        if SEQ in raw:
+            raw, conv, mid = raw.split(SEQ, 2)
+            self.conv = conv
+            try:
+                self.last_seen[conv] = max(self.last_seen.get(conv, 0), int(mid))
+            except ValueError:
+                pass
+        elif raw.startswith("GROUP/"):
+            parts = raw.split("/")
+            if len(parts) == 5 and parts[2].isdigit():
+                self.current_gid = int(parts[2])
+        return raw
+
+    # ---- reprise ----
+    def reconnect(self, stop: threading.Event | None = None) -> bool:
+        """
+        Se reconnecte (backoff exponentiel + full jitter) puis reprend la session avec le jeton.
+        Le serveur ne renvoie que les messages postérieurs à last_seen. False si jeton refusé.
+        """
+        if not self.token:
+            return False
+        stop = stop or threading.Event()
+        delay = RECONNECT_BASE
+        while not stop.is_set():
+            try:
+                self.connect()
+                state = {"current": self.current_gid, "seen": self.last_seen, "floor": self.floor}
+                self.send(f"@resume/{self.token}/{json.dumps(state)}")
+                return self.recv() == "@resumed"
+            except OSError:
+                pass
+            stop.wait(random.uniform(0, delay))
+            delay = min(delay * 2, RECONNECT_MAX)
+        return False
+
+    # ---- heartbeat ----
+    def start_heartbeat(self, interval: float = PING_INTERVAL, timeout: float = SERVER_TIMEOUT):
+        self._hb_stop.clear()
+        threading.Thread(target=self._heartbeat_loop, args=(interval, timeout), daemon=True).start()
+
+    def stop_heartbeat(self):
+        self._hb_stop.set()
+
+    def _heartbeat_loop(self, interval: float, timeout: float):
+        while not self._hb_stop.wait(interval):
+            if time.monotonic() - self.last_rx > timeout:
+                # serveur muet: couper pour débloquer recv() dans recv_loop
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except Exception:
+                    pass
+                return
+            try:
+                self.send("@ping")
+            except Exception:
+                return
+
+    # ---- fichiers ----
+    def _file_conn(self, header: str) -> tuple[socket.socket, str]:
+        s = self._wrap(socket.create_connection((self.host, self.file_port)))
+        s.sendall((header + "\n").encode("ascii"))
+        return s, _read_line(s)
+
+    def upload_file(self, path: str) -> str:
+        """envoie path (reprend là où le serveur s'est arrêté) ; renvoie son sha256"""
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(FILE_CHUNK), b""):
+                h.update(chunk)
+        sha = h.hexdigest()
+        size = os.path.getsize(path)
+        s, line = self._file_conn(f"PUT {self.token} {sha} {size}")
+        try:
+            if not line.startswith("OFFSET "):
+                raise OSError(f"upload refusé: {line}")
+            offset = int(line.split(" ")[1])
+            if offset < size:
+                with open(path, "rb") as f:
+                    s.sendfile(f, offset, size - offset)
+            line = _read_line(s)
+            if line != f"OK {sha}":
+                raise OSError(f"upload échoué: {line}")
+        finally:
+            s.close()
+        return sha
+
+    def download_file(self, sha: str, dest: str) -> str:
+        """télécharge le blob sha vers dest (reprise via dest + '.part')"""
+        part = dest + ".part"
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        s, line = self._file_conn(f"GET {self.token} {sha} {offset}")
+        try:
+            if not line.startswith("SIZE "):
+                raise OSError(f"download refusé: {line}")
+            remaining = int(line.split(" ")[1]) - offset
+            buf = bytearray(FILE_CHUNK)
+            mv = memoryview(buf)
+            with open(part, "ab") as f:
+                while remaining > 0:
+                    n = s.recv_into(mv, min(FILE_CHUNK, remaining))
+                    if not n:
+                        raise ConnectionError("transfert interrompu")
+                    f.write(mv[:n])
+                    remaining -= n
+        finally:
+            s.close()
+        h = hashlib.sha256()
+        with open(part, "rb") as f:
+            for chunk in iter(lambda: f.read(FILE_CHUNK), b""):
+                h.update(chunk)
+        if h.hexdigest() != sha:
+            os.remove(part)
+            raise OSError("fichier corrompu")
+        os.replace(part, dest)
+        return dest
+
+    def detach(self):
+        try:
+            self.sock.detach()
+        except Exception:
+            pass
+
+    def close(self):
+        self._keep_tls_session(self.sock)
+        try:
+            self.sock.close()
+        except Exception:
+            pass
+
+# ---------- Paquets ----------
+def parse_packet(raw: str) -> tuple:
+    """
+    Paquet serveur (tag d'id déjà retiré par ChatClient.recv) -> (kind, *données).
+    Le nombre de segments "/" donne le type (format historique du protocole) ;
+    les paquets de groupe se découpent par la fin (le texte peut contenir "/").
+    """
+    if raw == "@ping" or raw == "@pong":
+        return (raw[1:],)
+    # "@groups/[[gid, admin], ...]" : groupes de l'utilisateur (login / reprise)
+    if raw.startswith("@groups/"):
+        return ("groups", {int(gid): admin for gid, admin in json.loads(raw[len("@groups/"):])})
+    # "@convs/[[conv, last_id, last_ts, unread], ...]" : conversations, plus récente d'abord
+    if raw.startswith("@convs/"):
+        return ("convs", {conv: [last_id, last_ts, unread]
+                          for conv, last_id, last_ts, unread in json.loads(raw[len("@convs/"):])})
+    if raw.endswith("/group"):
+        parts = [raw[:-len("/group")], "group"]
+    elif "/group/historique/" in raw:
+        parts = raw.rsplit("/", 3)
+    else:
+        parts = raw.split("/")
+
+    if len(parts) == 1:
+        return ("global", parts[0])
+    if len(parts) == 5:
+        # "GROUP/<admin>/<gid>/ok/ok"
+        return ("role", int(parts[2]), parts[1])
+    if len(parts) == 2:
+        return ("group_line", None, parts[0])
+    if len(parts) == 3:
+        try:
+            names = [u[0] for u in json.loads(parts[0])]
+        except Exception:
+            names = []
+        return ("users", names)
+    if len(parts) == 4:
+        # "[[ligne, id], ...]/group/historique/<gid>" ; page plus ancienne : ".../<gid>@<avant>"
+        try:
+            messages = json.loads(parts[0])
+        except Exception:
+            messages = []
+        kind = "history"
+        key = parts[3]
+        if "@" in key:
+            kind, key = "older", key.split("@", 1)[0]
+        gid = int(key) if key.isdigit() else None
+        lines = [str(line[0] if isinstance(line, (list, tuple)) else line) for line in messages]
+        first = messages[0] if messages else None
+        oldest = first[1] if isinstance(first, list) and len(first) > 1 else None
+        return (kind, gid, lines, oldest)
+    return ("unknown", raw)
+
+# ---------- Session ----------
+class ChatSession:
+    """
+    Session utilisateur au-dessus de ChatClient : auth, état des groupes, réception.
+
+    on_event(kind, *args) est appelé depuis le thread de réception :
+        ("global", texte)             message / DM affiché dans la zone générale
+        ("groups", {gid: admin})      groupes de l'utilisateur
+        ("convs", {conv: [id, ts, n]}) conversations au login : dernier message, non-lus
+        ("role", gid, admin)          groupe créé / rejoint (devient le groupe courant)
+        ("group_line", gid, texte)    message de groupe live
+        ("users", [noms])             liste des utilisateurs (sans soi-même)
+        ("history", gid, [lignes])    page récente de l'historique d'un groupe
+        ("older", gid, [lignes])      page plus ancienne (request_older), avant les lignes connues
+        ("status", état)              "lost" | "reconnected" | "expired"
+    """
+    def __init__(self, host: str, port: int, tls_context: ssl.SSLContext | None = None,
+                 file_port: int | None = None, on_event=None):
+        self.client = ChatClient(host, port, tls_context, file_port)
+        self.on_event = on_event or (lambda kind, *args: None)
+        self.username = ""
+        self.all_users = []
+        self.groups = {}                # gid -> admin
+        self.group_lines = {}           # gid -> lignes reçues
+        self.convs = {}                 # "d:<nom>" / "g:<gid>" -> [dernier id, ts, non-lus]
+        self.oldest = {}                # gid -> id du plus ancien message d'historique reçu
+        self._history_asked = set()     # groupes dont la page récente a été demandée
+        self._reads = {}                # accusés de lecture pas encore envoyés : conv -> id
+        self._reads_lock = threading.Lock()
+        self._reads_timer = None
+        self.stop_event = threading.Event()
+        self.recv_thread = None
+
+    @property
+    def current_gid(self):
+        return self.client.current_gid
+
+    @current_gid.setter
+    def current_gid(self, gid):
+        self.client.current_gid = gid
+
+    def _new_connection(self):
+        """après un refus le serveur ferme la connexion : en ouvrir une neuve pour réessayer"""
+        c = self.client
+        c.detach()
+        self.client = ChatClient(c.host, c.port, c.tls_context, c.file_port)
+
+    # ---- auth ----
+    def signin(self, username: str, password: str) -> str:
+        """ "ok" | "unknown" (pas de compte) | "password" (mot de passe incorrect) """
+        self.client.send(f"{username}/{password}")
+        resp = self.client.recv()
+        rows = resp.split("/")
+        if username not in rows:
+            self._new_connection()
+            return "unknown"
+        self.all_users = [n for n in rows if n.strip() and n != username]
+        if self.client.recv() != password:
+            self._new_connection()
+            return "password"
+        self.username = username
+        return "ok"
+
+    def signup(self, username: str, email: str, password: str, password_confirm: str) -> str:
+        """ "ok" | "exists" (nom déjà pris) | "mismatch" (confirmation différente) """
+        self.client.send(f"{username}/{password}/{email}/{password_confirm}")
+        noms = self.client.recv().split("/")
+        if username in noms:
+            self._new_connection()
+            return "exists"
+        if password != password_confirm:
+            self._new_connection()
+            return "mismatch"
+        self.all_users = [n for n in noms if n.strip()]
+        self.username = username
+        return "ok"
+
+    # ---- réception ----
+    def start(self):
+        """lance la boucle de réception (thread) et le heartbeat"""
+        self.stop_event.clear()
+        self.recv_thread = threading.Thread(target=self.run, daemon=True)
+        self.recv_thread.start()
+        self.client.start_heartbeat()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                event = parse_packet(self.client.recv())
+            except OSError:
+                # socket morte (fermée par le serveur ou par le heartbeat) -> reprise
+                self.client.stop_heartbeat()
+                if self.stop_event.is_set():
+                    break
+                self.on_event("status", "lost")
+                if self.client.reconnect(self.stop_event):
+                    self.client.start_heartbeat()
+                    self.on_event("status", "reconnected")
+                    continue
+                if not self.stop_event.is_set():
+                    self.on_event("status", "expired")
+                break
+            except Exception:
+                continue
+            try:
+                self._dispatch(event)
+            except Exception:
+                # une erreur côté application ne doit pas tuer la réception
+                continue
+
+    def _dispatch(self, event: tuple):
+        kind = event[0]
+        if kind == "ping":
+            self.client.send("@pong")
+            return
+        if kind in ("pong", "unknown") or event == ("global", ""):
+            return
+        if kind == "convs":
+            self.convs = event[1]
+        elif kind == "groups":
+            self.groups = event[1]
+            if self.current_gid not in self.groups and self.groups:
+                self.current_gid = max(self.groups)
+        elif kind == "role":
+            # ChatClient a déjà basculé current_gid sur ce groupe
+            self.groups[event[1]] = event[2]
+        elif kind == "group_line":
+            conv = self.client.conv or ""
+            gid = int(conv[2:]) if conv.startswith("g:") else self.current_gid
+            lines = self.group_lines.setdefault(gid, [])
+            lines.append(event[2])
+            del lines[:-GROUP_LINES_MAX]
+            event = ("group_line", gid, event[2])
+            self._note_unread(event[2])
+        elif kind == "global":
+            self._note_unread(event[1])
+        elif kind == "users":
+            names = [n for n in event[1] if n != self.username]
+            self.all_users = names
+            event = ("users", names)
+        elif kind == "history":
+            gid = event[1] if event[1] is not None else self.current_gid
+            self.group_lines[gid] = event[2][-GROUP_LINES_MAX:]
+            self.oldest[gid] = event[3]
+            event = ("history", gid, event[2])
+        elif kind == "older":
+            gid = event[1]
+            # demandée explicitement : pas de plafond GROUP_LINES_MAX
+            self.group_lines.setdefault(gid, [])[:0] = event[2]
+            self.oldest[gid] = event[3]
+            event = ("older", gid, event[2])
+        self.on_event(*event)
+
+    def _note_unread(self, text: str):
+        """message live tagué : non-lu de plus dans sa conversation (sauf ses propres messages)"""
+        conv = self.client.conv
+        if conv is None:
+            return
+        entry = self.convs.setdefault(conv, [0, 0.0, 0])
+        entry[0] = self.client.last_seen.get(conv, entry[0])
+        entry[1] = time.time()
+        if not text.startswith(f"{self.username}:"):
+            entry[2] += 1
+
+    async def aevents(self):
+        """
+        Variante asyncio : `async for kind, *args in session.aevents()`.
+        Démarre la réception ; se termine sur ("status", "expired") ou après stop().
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        self.on_event = lambda *event: loop.call_soon_threadsafe(queue.put_nowait, event)
+        self.start()
+        while not self.stop_event.is_set():
+            event = await queue.get()
+            yield event
+            if event == ("status", "expired"):
+                return
+
+    # ---- actions ----
+    def send_direct(self, text: str, target: str):
+        self.client.send(f"{text}/{target}")
+
+    def send_group(self, text: str, gid: int | None = None):
+        gid = self.current_gid if gid is None else gid
+        self.client.send(f"@g/{gid}/{text}" if gid is not None else text)
+
+    def request_history(self, gid: int | None = None):
+        gid = self.current_gid if gid is None else gid
+        self.client.send(f"Historique/{gid}" if gid is not None else "Historique")
+
+    def open_group(self, gid: int):
+        """groupe affiché : devient courant ; à la première ouverture, demande sa page récente (fixe oldest)"""
+        self.current_gid = gid
+        if gid not in self._history_asked:
+            self._history_asked.add(gid)
+            self.request_history(gid)
+
+    def request_older(self, gid: int | None = None) -> bool:
+        """page d'historique précédant la plus ancienne reçue ; False si rien de plus ancien"""
+        gid = self.current_gid if gid is None else gid
+        before = self.oldest.get(gid)
+        if gid is None or not before:
+            return False
+        self.client.send(f"Historique/{gid}/{before}")
+        return True
+
+    def request_users(self):
+        self.client.send("list/new/list")
+
+    def create_group(self, members: list[str]):
+        self.client.send(f"{json.dumps(members)}@addgroup")
+
+    def add_members(self, members: list[str], gid: int | None = None):
+        gid = self.current_gid if gid is None else gid
+        group_json = json.dumps(members)
+        self.client.send(f"@addmembers/{gid}/{group_json}" if gid is not None else f"{group_json}@addgroup@new")
+
+    def unread(self, conv: str) -> int:
+        entry = self.convs.get(conv)
+        return entry[2] if entry else 0
+
+    def mark_read(self, conv: str, mid: int | None = None):
+        """
+        Conversation lue jusqu'à mid (par défaut le dernier id reçu) ; l'accusé part
+        regroupé avec les autres après READ_ACK_DELAY (ou au stop()).
+        """
+        entry = self.convs.get(conv)
+        if mid is None:
+            mid = self.client.last_seen.get(conv) or (entry[0] if entry else None)
+        if not mid:
+            return
+        if entry is not None and mid >= entry[0]:
+            entry[2] = 0
+        with self._reads_lock:
+            if mid <= self._reads.get(conv, 0):
+                return
+            self._reads[conv] = mid
+            if self._reads_timer is None:
+                self._reads_timer = threading.Timer(READ_ACK_DELAY, self.flush_reads)
+                self._reads_timer.daemon = True
+                self._reads_timer.start()
+
+    def flush_reads(self):
+        with self._reads_lock:
+            reads, self._reads = self._reads, {}
+            self._reads_timer = None
+        try:
+            while reads:
+                conv, mid = next(iter(reads.items()))
+                self.client.send(f"@read/{conv}/{mid}")
+                del reads[conv]
+        except OSError:
+            # connexion perdue : gardés pour le prochain envoi
+            with self._reads_lock:
+                for conv, mid in reads.items():
+                    self._reads[conv] = max(mid, self._reads.get(conv, 0))
+
+    def rename(self, new_name: str):
+        self.username = new_name
+        self.client.send(f"{new_name}!changerlenom")
+
+    def stop(self, close: bool = False):
+        """arrête la réception ; close=True ferme la socket (sinon detach, comme la déconnexion UI)"""
+        self.stop_event.set()
+        self.client.stop_heartbeat()
+        with self._reads_lock:
+            if self._reads_timer is not None:
+                self._reads_timer.cancel()
+        self.flush_reads()
+        try:
+            if close:
+                self.client.close()
+            else:
+                self.client.detach()
+        except Exception:
+            pass
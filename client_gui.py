@@ -0,0 +1,579 @@
+# -*- coding: utf-8 -*-
+"""Interface de bureau (CustomTkinter) ; le réseau et le protocole sont dans chat_core.py."""
+import os
+import ssl
+import sys
+import tkinter.messagebox as messagebox
+
+import customtkinter as ctk
+
+from chat_core import ChatSession
+
+# ---------- Utilitaire ----------
+def resource_path(relative_path: str) -> str:
+    try:
+        base_path = sys._MEIPASS  # type: ignore[attr-defined]
+    except Exception:
+        base_path = os.path.abspath(".")
+    return os.path.join(base_path, relative_path)
+
+# ---------- Application ----------
+class ModernChatApp(ctk.CTk):
+    def __init__(self, server_host: str, server_port: int, tls_context: ssl.SSLContext | None = None):
+        super().__init__()
+        ctk.set_appearance_mode("dark")
+        ctk.set_default_color_theme("blue")
+
+        self.title("Instant Messaging")
+        self.geometry("1100x640")
+        self.minsize(980, 600)
+
+        try:
+            self.iconbitmap(resource_path("messager.ico"))
+        except Exception:
+            pass
+
+        self.session = ChatSession(server_host, server_port, tls_context, on_event=self.on_event)
+        self.group_buffer = []
+        self.group_add_buffer = []
+
+        self.signin_frame = None
+        self.signup_frame = None
+        self.chat_frame = None
+
+        self.show_signin()
+
+    @property
+    def username(self) -> str:
+        return self.session.username
+
+    @property
+    def all_users(self) -> list[str]:
+        return self.session.all_users
+
+    # ---- navigation écrans ----
+    def clear_main(self):
+        for w in self.winfo_children():
+            w.destroy()
+
+    def show_signin(self):
+        self.clear_main()
+        self.signin_frame = SignInFrame(self, on_signin=self.handle_signin, on_switch_signup=self.show_signup)
+        self.signin_frame.pack(fill="both", expand=True)
+
+    def show_signup(self):
+        self.clear_main()
+        self.signup_frame = SignUpFrame(self, on_signup=self.handle_signup, on_switch_signin=self.show_signin)
+        self.signup_frame.pack(fill="both", expand=True)
+
+    def show_chat(self):
+        self.clear_main()
+        self.chat_frame = ChatFrame(
+            self,
+            on_send_direct=self.send_direct_message,
+            on_send_group_text=self.send_group_text,
+            on_request_history=self.request_history,
+            on_request_older=self.request_older,
+            on_logout=self.logout,
+            on_clear_chat=self.clear_group_area,
+            on_create_group=self.create_group,
+            on_add_members=self.add_members_to_group,
+            on_refresh_users=self.refresh_users,
+            on_change_name=self.change_username,
+            on_switch_group=self.switch_group
+        )
+        self.chat_frame.pack(fill="both", expand=True)
+
+        # pousser la liste connue (DM + picker de droite)
+        self.chat_frame.update_user_list(self.all_users or [" "])
+
+        self.session.start()
+
+    # ---- auth ----
+    def handle_signin(self, username: str, password: str):
+        try:
+            result = self.session.signin(username, password)
+            if result == "unknown":
+                if not messagebox.askretrycancel("Erreur", "Vous n'avez pas de compte. Cliquez sur Sign Up."):
+                    self.show_signin()
+                return
+            if result == "password":
+                if not messagebox.askretrycancel("Erreur", "Mot de passe incorrect. Réessayer ?"):
+                    self.show_signin()
+                return
+
+            self.group_buffer = [username]
+            self.show_chat()
+
+        except Exception as e:
+            messagebox.showerror("Connexion", f"Échec de connexion: {e}")
+
+    def handle_signup(self, username: str, email: str, password: str, password_confirm: str):
+        try:
+            result = self.session.signup(username, email, password, password_confirm)
+            if result == "exists":
+                if not messagebox.askretrycancel("Erreur", "Compte déjà existant. Cliquez sur Sign In ou changez le username."):
+                    self.show_signin()
+                return
+            if result == "mismatch":
+                messagebox.showwarning("Erreur", "La confirmation du mot de passe est incorrecte.")
+                return
+
+            self.group_buffer = [username]
+            self.show_chat()
+
+        except Exception as e:
+            messagebox.showerror("Inscription", f"Erreur: {e}")
+
+    # ---- réception ----
+    def on_event(self, kind: str, *args):
+        """événements de ChatSession (thread de réception)"""
+        if kind == "global":
+            if self.chat_frame:
+                self.chat_frame.append_global(args[0])
+                conv = self.session.client.conv
+                if conv and conv.startswith("d:"):
+                    self.session.mark_read(conv)
+        elif kind == "convs":
+            self.on_conversations(args[0])
+        elif kind == "groups":
+            # groupe courant affiché dès la connexion : sa page récente arme "Plus anciens"
+            if self.session.current_gid in self.session.groups:
+                self.show_group(self.session.current_gid)
+            else:
+                self.refresh_groups()
+        elif kind == "role":
+            self.show_group(args[0])
+        elif kind == "group_line":
+            self.on_group_line(*args)
+        elif kind == "users":
+            if self.chat_frame:
+                self.chat_frame.update_user_list(args[0] or [" "])
+        elif kind == "history":
+            if args[0] == self.session.current_gid:
+                self.show_group(args[0])
+        elif kind == "older":
+            if args[0] == self.session.current_gid and self.chat_frame:
+                self.chat_frame.prepend_group(args[1])
+        elif kind == "status" and self.chat_frame:
+            self.chat_frame.append_global({
+                "lost": "Connexion perdue, reconnexion...",
+                "reconnected": "Reconnecté.",
+                "expired": "Session expirée, reconnecte-toi.",
+            }[args[0]])
+
+    # ---- actions chat ----
+    def send_direct_message(self, text: str, target: str):
+        if not text.strip() or target.strip() == "":
+            return
+        self.session.send_direct(text, target)
+
+    def send_group_text(self, text: str):
+        if not text.strip():
+            return
+        self.session.send_group(text)
+
+    def request_history(self):
+        self.session.request_history()
+
+    def request_older(self):
+        """page d'historique précédant les lignes affichées (HISTORY_PAGE messages côté serveur)"""
+        if not self.session.request_older():
+            messagebox.showinfo("Historique", "Pas de messages plus anciens.")
+
+    def on_conversations(self, convs: dict):
+        """au login : DM non lus résumés (ils viennent d'être affichés), compteurs des groupes"""
+        for conv, (_, _, n) in convs.items():
+            if conv.startswith("d:") and n:
+                if self.chat_frame:
+                    self.chat_frame.append_global(f"{n} message(s) non lu(s) de {conv[2:]}")
+                self.session.mark_read(conv)
+        self.refresh_groups()
+
+    # ---- groupes ----
+    def on_group_line(self, gid, text: str):
+        # ligne déjà rangée dans session.group_lines ; non-lus comptés par la session
+        if gid == self.session.current_gid:
+            if self.chat_frame:
+                self.chat_frame.append_group(text)
+            self.session.mark_read(f"g:{gid}")
+        else:
+            self.refresh_groups()
+
+    def group_label(self, gid: int) -> str:
+        n = self.session.unread(f"g:{gid}")
+        return f"Groupe {gid}" + (f" ({n})" if n else "")
+
+    def refresh_groups(self):
+        if not self.chat_frame:
+            return
+        groups = self.session.groups
+        gids = sorted(groups)
+        current = self.session.current_gid
+        self.chat_frame.update_group_list([self.group_label(g) for g in gids],
+                                          self.group_label(current) if current in groups else None)
+        if current in groups:
+            self.chat_frame.ensure_group_mode(admin=(groups[current] == self.username))
+
+    def show_group(self, gid: int):
+        self.session.open_group(gid)
+        self.session.mark_read(f"g:{gid}")
+        if self.chat_frame:
+            self.chat_frame.set_group_lines(self.session.group_lines.get(gid, []))
+        self.refresh_groups()
+
+    def switch_group(self, label: str):
+        try:
+            gid = int(label.split()[1])
+        except (IndexError, ValueError):
+            return
+        self.show_group(gid)
+
+    def clear_group_area(self):
+        if self.chat_frame:
+            self.chat_frame.clear_group_area()
+
+    def refresh_users(self):
+        self.session.request_users()
+
+    def create_group(self):
+        if self.username not in self.group_buffer:
+            self.group_buffer.insert(0, self.username)
+        if len(self.group_buffer) < 2:
+            messagebox.showinfo("Groupe", "Ajoute au moins un membre.")
+            return
+        self.session.create_group(self.group_buffer)
+        self.group_buffer = [self.username]
+
+    def add_members_to_group(self):
+        if not self.group_add_buffer:
+            messagebox.showinfo("Groupe", "Aucun membre à ajouter.")
+            return
+        self.session.add_members(self.group_add_buffer)
+        self.group_add_buffer.clear()
+
+    def change_username(self, new_name: str):
+        if not new_name.strip():
+            return
+        self.session.rename(new_name.strip())
+        if self.chat_frame:
+            self.chat_frame.set_profile_name(self.username)
+        if self.username not in self.group_buffer:
+            self.group_buffer.insert(0, self.username)
+
+    # ---- sortie ----
+    def logout(self):
+        if messagebox.askyesno("Déconnexion", "Voulez-vous vous déconnecter ?"):
+            self.session.stop()
+            self.show_signin()
+
+    def on_closing(self):
+        self.session.stop(close=True)
+        self.destroy()
+
+# ---------- Écrans ----------
+class SignInFrame(ctk.CTkFrame):
+    def __init__(self, master: ModernChatApp, on_signin, on_switch_signup):
+        super().__init__(master)
+        self.on_signin = on_signin
+        self.on_switch_signup = on_switch_signup
+
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=0)
+        self.grid_rowconfigure(2, weight=2)
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_columnconfigure(1, weight=1)
+
+        left = ctk.CTkFrame(self, corner_radius=16)
+        left.grid(row=0, column=0, rowspan=3, sticky="nsew", padx=(24, 12), pady=24)
+        left.grid_rowconfigure(1, weight=1)
+        ctk.CTkLabel(left, text="Instant Messaging", font=ctk.CTkFont(size=24, weight="bold")).pack(pady=(24, 8))
+        ctk.CTkLabel(left, text="Connecte-toi pour discuter", font=ctk.CTkFont(size=14)).pack()
+
+        right = ctk.CTkFrame(self, corner_radius=16)
+        right.grid(row=0, column=1, rowspan=3, sticky="nsew", padx=(12, 24), pady=24)
+        right.grid_columnconfigure(0, weight=1)
+
+        self.username = ctk.CTkEntry(right, placeholder_text="User name", height=44)
+        self.username.grid(row=0, column=0, padx=24, pady=(48, 12), sticky="ew")
+
+        self.password = ctk.CTkEntry(right, placeholder_text="Password", show="•", height=44)
+        self.password.grid(row=1, column=0, padx=24, pady=12, sticky="ew")
+
+        ctk.CTkButton(right, text="Se connecter", height=44, command=self._do_signin)\
+            .grid(row=2, column=0, padx=24, pady=(12, 6), sticky="ew")
+
+        ctk.CTkButton(right, text="Sign up", height=40, fg_color="transparent", border_width=1,
+                      command=self.on_switch_signup)\
+            .grid(row=3, column=0, padx=24, pady=(6, 24), sticky="ew")
+
+        self.username.bind("<Return>", lambda e: self._do_signin())
+        self.password.bind("<Return>", lambda e: self._do_signin())
+
+    def _do_signin(self):
+        self.on_signin(self.username.get().strip(), self.password.get().strip())
+
+class SignUpFrame(ctk.CTkFrame):
+    def __init__(self, master: ModernChatApp, on_signup, on_switch_signin):
+        super().__init__(master)
+        self.on_signup = on_signup
+        self.on_switch_signin = on_switch_signin
+
+        self.grid_columnconfigure(0, weight=1)
+        card = ctk.CTkFrame(self, corner_radius=16)
+        card.grid(row=0, column=0, padx=24, pady=24, sticky="nsew")
+        card.grid_columnconfigure(0, weight=1)
+
+        ctk.CTkLabel(card, text="Authentification", font=ctk.CTkFont(size=22, weight="bold"))\
+            .grid(row=0, column=0, pady=(24, 12))
+
+        self.username = ctk.CTkEntry(card, placeholder_text="User name", height=44)
+        self.username.grid(row=1, column=0, padx=24, pady=8, sticky="ew")
+
+        self.email = ctk.CTkEntry(card, placeholder_text="Email", height=44)
+        self.email.grid(row=2, column=0, padx=24, pady=8, sticky="ew")
+
+        self.password = ctk.CTkEntry(card, placeholder_text="Password", show="•", height=44)
+        self.password.grid(row=3, column=0, padx=24, pady=8, sticky="ew")
+
+        self.password2 = ctk.CTkEntry(card, placeholder_text="Password confirmation", show="•", height=44)
+        self.password2.grid(row=4, column=0, padx=24, pady=8, sticky="ew")
+
+        ctk.CTkButton(card, text="Enregistrer", height=44, command=self._do_signup)\
+            .grid(row=5, column=0, padx=24, pady=(12, 6), sticky="ew")
+
+        ctk.CTkButton(card, text="Sign in", height=40, fg_color="transparent", border_width=1,
+                      command=self.on_switch_signin)\
+            .grid(row=6, column=0, padx=24, pady=(6, 24), sticky="ew")
+
+        for w in (self.username, self.email, self.password, self.password2):
+            w.bind("<Return>", lambda e: self._do_signup())
+
+    def _do_signup(self):
+        self.on_signup(self.username.get().strip(),
+                       self.email.get().strip(),
+                       self.password.get().strip(),
+                       self.password2.get().strip())
+
+class ChatFrame(ctk.CTkFrame):
+    def __init__(self, master: ModernChatApp,
+                 on_send_direct, on_send_group_text, on_request_history, on_request_older,
+                 on_logout, on_clear_chat, on_create_group, on_add_members,
+                 on_refresh_users, on_change_name, on_switch_group):
+        super().__init__(master)
+        self.master_app = master
+        self.on_send_direct = on_send_direct
+        self.on_send_group_text = on_send_group_text
+        self.on_request_history = on_request_history
+        self.on_request_older = on_request_older
+        self.on_logout = on_logout
+        self.on_clear_chat = on_clear_chat
+        self.on_create_group = on_create_group
+        self.on_add_members = on_add_members
+        self.on_refresh_users = on_refresh_users
+        self.on_change_name = on_change_name
+        self.on_switch_group = on_switch_group
+
+        self.grid_rowconfigure(1, weight=1)
+        self.grid_columnconfigure(1, weight=1)
+
+        # Top bar
+        topbar = ctk.CTkFrame(self, height=56, corner_radius=0)
+        topbar.grid(row=0, column=0, columnspan=3, sticky="nsew")
+        topbar.grid_columnconfigure(3, weight=1)
+        self.profile_label = ctk.CTkLabel(topbar, text=f"Connecté: {self.master_app.username}",
+                                          font=ctk.CTkFont(size=14, weight="bold"))
+        self.profile_label.grid(row=0, column=0, padx=16)
+        ctk.CTkButton(topbar, text="Actualiser", command=self.on_refresh_users, height=36, width=110)\
+            .grid(row=0, column=1, padx=8, pady=10)
+        ctk.CTkButton(topbar, text="Déconnexion", command=self.on_logout, height=36, width=110)\
+            .grid(row=0, column=2, padx=8, pady=10)
+
+        # Panneau gauche (Messages + DM)
+        left = ctk.CTkFrame(self, corner_radius=12)
+        left.grid(row=1, column=0, padx=16, pady=(12, 16), sticky="nsew")
+        left.grid_rowconfigure(1, weight=1)
+        left.grid_columnconfigure(0, weight=1)
+
+        ctk.CTkLabel(left, text="Messages", font=ctk.CTkFont(size=16, weight="bold"))\
+            .grid(row=0, column=0, padx=12, pady=(12, 0), sticky="w")
+
+        self.global_text = ctk.CTkTextbox(left)
+        self.global_text.grid(row=1, column=0, padx=12, pady=12, sticky="nsew")
+        self.global_text.configure(state="disabled")
+
+        dm_bar = ctk.CTkFrame(left, fg_color="transparent")
+        dm_bar.grid(row=2, column=0, sticky="ew", padx=12, pady=(0, 12))
+        dm_bar.grid_columnconfigure(1, weight=1)
+
+        self.dm_target = ctk.CTkOptionMenu(dm_bar, values=self.master_app.all_users or [" "], width=180)
+        self.dm_target.grid(row=0, column=0, padx=(0, 8))
+        self.dm_entry = ctk.CTkEntry(dm_bar, placeholder_text="Message direct...", height=40)
+        self.dm_entry.grid(row=0, column=1, sticky="ew")
+        ctk.CTkButton(dm_bar, text="Envoyer", command=lambda: self._send_dm())\
+            .grid(row=0, column=2, padx=8)
+        self.dm_entry.bind("<Return>", lambda e: self._send_dm())
+
+        # Panneau central (Groupe)
+        center = ctk.CTkFrame(self, corner_radius=12)
+        center.grid(row=1, column=1, padx=(0, 16), pady=(12, 16), sticky="nsew")
+        center.grid_rowconfigure(1, weight=1)
+        center.grid_columnconfigure(0, weight=1)
+
+        self.group_title = ctk.CTkLabel(center, text="Groupe (Admin)", font=ctk.CTkFont(size=16, weight="bold"))
+        self.group_title.grid(row=0, column=0, padx=12, pady=(12, 0), sticky="w")
+
+        # sélecteur du groupe affiché (un utilisateur peut être dans plusieurs groupes)
+        self.group_picker = ctk.CTkOptionMenu(center, values=[" "], width=160,
+                                              command=lambda v: self.on_switch_group(v))
+        self.group_picker.grid(row=0, column=0, padx=12, pady=(12, 0), sticky="e")
+
+        self.group_text = ctk.CTkTextbox(center)
+        self.group_text.grid(row=1, column=0, padx=12, pady=12, sticky="nsew")
+        self.group_text.configure(state="disabled")
+
+        group_bar = ctk.CTkFrame(center, fg_color="transparent")
+        group_bar.grid(row=2, column=0, sticky="ew", padx=12, pady=(0, 12))
+        # très important: laisser la colonne 0 prendre toute la largeur
+        group_bar.grid_columnconfigure(0, weight=1)
+        group_bar.grid_columnconfigure(1, weight=0)
+        group_bar.grid_columnconfigure(2, weight=0)
+        group_bar.grid_columnconfigure(3, weight=0)
+
+        ctk.CTkButton(group_bar, text="Plus anciens", width=110, command=self.on_request_older)\
+            .grid(row=0, column=0, padx=(0, 8), sticky="w")
+
+        # >>> L'ENTRY DU GROUPE (bien visible)
+        self.group_entry = ctk.CTkEntry(
+            group_bar,
+            placeholder_text="Message au groupe...",
+            height=44,
+            width=300,
+            border_width=1,
+            border_color=("gray70", "gray30"),
+            fg_color=("gray95", "gray15"),   # un peu plus clair sur thème dark
+            text_color=("black", "white")
+        )
+        self.group_entry.grid(row=0, column=1, sticky="ew", padx=(0, 8))
+        self.group_entry.bind("<Return>", lambda e: self._send_group())
+
+        ctk.CTkButton(group_bar, text="Envoyer", command=lambda: self._send_group())\
+            .grid(row=0, column=2, padx=8)
+        # ctk.CTkButton(group_bar, text="Effacer", command=self.on_clear_chat)\
+        #     .grid(row=0, column=3, padx=8)
+
+        # Panneau droit (Utilisateurs / Groupe)
+        right = ctk.CTkFrame(self, corner_radius=12, width=260)
+        right.grid(row=1, column=2, padx=(0, 16), pady=(12, 16), sticky="nsew")
+        right.grid_columnconfigure(0, weight=1)
+
+        ctk.CTkLabel(right, text="Utilisateurs", font=ctk.CTkFont(size=16, weight="bold"))\
+            .grid(row=0, column=0, padx=12, pady=(12, 8), sticky="w")
+
+        self.user_picker = ctk.CTkOptionMenu(right, values=self.master_app.all_users or [" "])
+        self.user_picker.grid(row=1, column=0, padx=12, pady=6, sticky="ew")
+
+        ctk.CTkButton(right, text="Ajouter à la sélection",
+                      command=self._add_selected_to_group)\
+            .grid(row=2, column=0, padx=12, pady=(4, 12), sticky="ew")
+
+        self.sel_list = ctk.CTkTextbox(right, height=110)
+        self.sel_list.grid(row=3, column=0, padx=12, pady=(0, 12), sticky="nsew")
+        self.sel_list.configure(state="disabled")
+
+        ctk.CTkButton(right, text="Créer le groupe", command=self.on_create_group)\
+            .grid(row=4, column=0, padx=12, pady=(0, 8), sticky="ew")
+
+        ctk.CTkButton(right, text="Ajouter ces membres", command=self.on_add_members)\
+            .grid(row=5, column=0, padx=12, pady=(0, 12), sticky="ew")
+
+        ctk.CTkLabel(right, text="Changer de nom", font=ctk.CTkFont(size=14, weight="bold"))\
+            .grid(row=6, column=0, padx=12, pady=(8, 6), sticky="w")
+        self.rename_entry = ctk.CTkEntry(right, placeholder_text="Nouveau nom")
+        self.rename_entry.grid(row=7, column=0, padx=12, pady=(0, 6), sticky="ew")
+        ctk.CTkButton(right, text="Appliquer",
+                      command=lambda: self.on_change_name(self.rename_entry.get().strip()))\
+            .grid(row=8, column=0, padx=12, pady=(0, 12), sticky="ew")
+
+    # --- UI helpers ---
+    def update_user_list(self, names):
+        if not names:
+            names = [" "]
+        # picker de droite
+        self.user_picker.configure(values=names)
+        if names:
+            self.user_picker.set(names[0])
+        # menu DM
+        try:
+            self.dm_target.configure(values=names)
+            if names:
+                self.dm_target.set(names[0])
+        except Exception:
+            pass
+
+    def update_group_list(self, labels, current):
+        self.group_picker.configure(values=labels or [" "])
+        self.group_picker.set(current or " ")
+
+    def set_group_lines(self, lines):
+        self.group_text.configure(state="normal")
+        self.group_text.delete("1.0", "end")
+        for line in lines:
+            self.group_text.insert("end", line if line.endswith("\n") else line + "\n")
+        self.group_text.see("end")
+        self.group_text.configure(state="disabled")
+
+    def prepend_group(self, lines):
+        """page plus ancienne : insérée au-dessus, vue laissée sur le début"""
+        if not lines:
+            return
+        self.group_text.configure(state="normal")
+        self.group_text.insert("1.0", "".join(l if l.endswith("\n") else l + "\n" for l in lines))
+        self.group_text.see("1.0")
+        self.group_text.configure(state="disabled")
+
+    def ensure_group_mode(self, admin: bool):
+        self.group_title.configure(text=f"Groupe ({'Admin' if admin else 'Membre'})")
+
+    def append_global(self, text: str):
+        self.global_text.configure(state="normal")
+        self.global_text.insert("end", text if text.endswith("\n") else text + "\n")
+        self.global_text.see("end")
+        self.global_text.configure(state="disabled")
+
+    def append_group(self, text: str):
+        self.group_text.configure(state="normal")
+        self.group_text.insert("end", text if text.endswith("\n") else text + "\n")
+        self.group_text.see("end")
+        self.group_text.configure(state="disabled")
+
+    def clear_group_area(self):
+        self.group_text.configure(state="normal")
+        self.group_text.delete("1.0", "end")
+        self.group_text.configure(state="disabled")
+
+    def _send_dm(self):
+        target = self.dm_target.get().strip()
+        msg = self.dm_entry.get().strip()
+        if target and target != " " and msg:
+            self.on_send_direct(msg, target)
+            self.dm_entry.delete(0, "end")
+
+    def _send_group(self):
+        msg = self.group_entry.get().strip()
+        if msg:
+            self.on_send_group_text(msg)
+            self.group_entry.delete(0, "end")
+
+    def _add_selected_to_group(self):
+        name = self.user_picker.get().strip()
+        if not name or name == " ":
+            return
+        self.master_app.group_buffer.append(name)
+        self.master_app.group_add_buffer.append(name)
+        self.sel_list.configure(state="normal")
+        self.sel_list.insert("end", f"• {name}\n")
+        self.sel_list.configure(state="disabled")
+
+    def set_profile_name(self, new_name: str):
+        self.profile_label.configure(text=f"Connecté: {new_name}")
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Transfert de fichiers / images, séparé du chat.
+
+Le serveur de fichiers écoute sur son propre port (SERVER_PORT + 1) avec ses propres
+threads : un gros transfert ne passe jamais par handle_client ni par le port du chat.
+Les blobs sont adressés par contenu (sha256) -> un même fichier n'est stocké qu'une fois.
+
+Protocole (une ligne d'en-tête ASCII, puis des octets bruts) :
+    PUT <token> <sha256> <size>\n    -> "OFFSET <n>\n"   (n octets déjà reçus : reprise)
+                                        le client envoie [n:size]
+                                     -> "OK <sha256>\n" | "ERR <raison>\n"
+    GET <token> <sha256> <offset>\n  -> "SIZE <n>\n" puis les octets [offset:n]
+                                      | "ERR <raison>\n"
+"""
+import hashlib
+import os
+import socket
+import threading
+import time
+
+CHUNK = 256 * 1024           # taille des lectures / envois
+MAX_TRANSFERS = 8            # transferts simultanés max (au-delà: "ERR busy")
+RATE_LIMIT = 8 * 1024 * 1024 # octets/s, tous transferts confondus (0 = illimité)
+MAX_HEADER = 512
+HEADER_TIMEOUT = 10.0        # s pour le handshake TLS + la ligne d'en-tête (avant de prendre un créneau)
+IO_TIMEOUT = 60.0            # s sans progrès pendant un transfert
+MAX_SIZE = 100 * 1024 * 1024 # taille max d'un fichier
+
+# ---------- Utilitaires ----------
+def sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    buf = bytearray(CHUNK)
+    mv = memoryview(buf)
+    with open(path, "rb") as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(mv[:n])
+    return h.hexdigest()
+
+def _recv_line(sock: socket.socket, deadline: float | None = None) -> str:
+    """lit une ligne d'en-tête octet par octet (ne consomme rien des données qui suivent)"""
+    out = bytearray()
+    while len(out) < MAX_HEADER:
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError("en-tête trop lent")
+        b = sock.recv(1)
+        if not b:
+            raise ConnectionError
+        if b == b"\n":
+            return out.decode("ascii")
+        out += b
+    raise ValueError("en-tête trop long")
+
+def _is_sha(s: str) -> bool:
+    return len(s) == 64 and all(c in "0123456789abcdef" for c in s)
+
+class Throttle:
+    """seau à jetons partagé : plafonne le débit total des transferts"""
+    def __init__(self, rate: int):
+        self.rate = rate
+        self.allow = float(rate)
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, n: int):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.allow = min(self.rate, self.allow + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.allow -= n
+            wait = -self.allow / self.rate if self.allow < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+# ---------- Stockage ----------
+class BlobStore:
+    """blobs/<sha[:2]>/<sha> ; uploads partiels dans blobs/tmp/<sha>.part"""
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(os.path.join(root, "tmp"), exist_ok=True)
+
+    def path(self, sha: str) -> str:
+        return os.path.join(self.root, sha[:2], sha)
+
+    def part_path(self, sha: str) -> str:
+        return os.path.join(self.root, "tmp", sha + ".part")
+
+    def has(self, sha: str) -> bool:
+        return os.path.exists(self.path(sha))
+
+    def part_size(self, sha: str) -> int:
+        try:
+            return os.path.getsize(self.part_path(sha))
+        except OSError:
+            return 0
+
+    def commit(self, sha: str) -> bool:
+        """vérifie le contenu reçu puis le publie sous son hash"""
+        part = self.part_path(sha)
+        if sha256_file(part) != sha:
+            os.remove(part)
+            return False
+        os.makedirs(os.path.dirname(self.path(sha)), exist_ok=True)
+        os.replace(part, self.path(sha))
+        return True
+
+# ---------- Serveur ----------
+class FileServer:
+    """
+    auth(token) -> nom | None : valide le jeton de session du chat (table sessions).
+    ssl_context : TLS optionnel (sous TLS, sendfile retombe sur des send() classiques).
+    """
+    def __init__(self, host: str, port: int, root: str, auth, ssl_context=None):
+        self.store = BlobStore(root)
+        self.auth = auth
+        self.ssl_context = ssl_context
+        self.throttle = Throttle(RATE_LIMIT)
+        self.slots = threading.BoundedSemaphore(MAX_TRANSFERS)
+        self.inflight = set()            # sha en cours d'upload
+        self.lock = threading.Lock()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen()
+        self.port = self.sock.getsockname()[1]   # port réel (port=0 -> éphémère)
+
+    def start(self):
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+
+    def stop(self):
+        """n'accepte plus de transfert (ceux en cours se terminent dans leur thread)"""
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def accept_loop(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def handle(self, conn: socket.socket):
+        slot = False
+        try:
+            # handshake + en-tête authentifié d'abord, délai court : une connexion muette
+            # ou anonyme ne bloque pas de créneau de transfert
+            conn.settimeout(HEADER_TIMEOUT)
+            deadline = time.monotonic() + HEADER_TIMEOUT
+            if self.ssl_context is not None:
+                conn = self.ssl_context.wrap_socket(conn, server_side=True)
+            parts = _recv_line(conn, deadline).split(" ")
+            if len(parts) != 4 or self.auth(parts[1]) is None or not _is_sha(parts[2]):
+                self._reply(conn, "ERR auth")
+                return
+            slot = self.slots.acquire(blocking=False)
+            if not slot:
+                self._reply(conn, "ERR busy")
+                return
+            conn.settimeout(IO_TIMEOUT)
+            op, _, sha, num = parts
+            if op == "PUT":
+                self._put(conn, sha, int(num))
+            elif op == "GET":
+                self._get(conn, sha, int(num))
+            else:
+                self._reply(conn, "ERR op")
+        except Exception:
+            pass
+        finally:
+            if slot:
+                self.slots.release()
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _reply(self, conn: socket.socket, line: str):
+        try:
+            conn.sendall((line + "\n").encode("ascii"))
+        except Exception:
+            pass
+
+    def _put(self, conn: socket.socket, sha: str, size: int):
+        if not 0 <= size <= MAX_SIZE:
+            self._reply(conn, "ERR size")
+            return
+        # dédup : déjà stocké -> rien à envoyer
+        if self.store.has(sha):
+            self._reply(conn, f"OFFSET {size}")
+            self._reply(conn, f"OK {sha}")
+            return
+        with self.lock:
+            if sha in self.inflight:
+                self._reply(conn, "ERR busy")
+                return
+            self.inflight.add(sha)
+        try:
+            offset = min(self.store.part_size(sha), size)
+            self._reply(conn, f"OFFSET {offset}")
+            buf = bytearray(CHUNK)
+            mv = memoryview(buf)
+            remaining = size - offset
+            with open(self.store.part_path(sha), "ab") as f:
+                while remaining:
+                    n = conn.recv_into(mv, min(CHUNK, remaining))
+                    if not n:
+                        return          # coupure : le .part permettra la reprise
+                    f.write(mv[:n])
+                    remaining -= n
+                    self.throttle.consume(n)
+            self._reply(conn, f"OK {sha}" if self.store.commit(sha) else "ERR hash")
+        finally:
+            with self.lock:
+                self.inflight.discard(sha)
+
+    def _get(self, conn: socket.socket, sha: str, offset: int):
+        if not self.store.has(sha):
+            self._reply(conn, "ERR missing")
+            return
+        path = self.store.path(sha)
+        size = os.path.getsize(path)
+        offset = max(0, min(offset, size))
+        self._reply(conn, f"SIZE {size}")
+        with open(path, "rb") as f:
+            # sendfile : le noyau copie fichier -> socket sans passer par Python
+            while offset < size:
+                count = min(CHUNK, size - offset)
+                sent = conn.sendfile(f, offset, count)
+                if not sent:
+                    return
+                offset += sent
+                self.throttle.consume(sent)
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Cache mémoire de l'historique récent des groupes : un anneau par groupe, éléments déjà sérialisés.
+
+Un anneau garde les LINES derniers messages d'un groupe sous forme d'éléments JSON
+'["ligne", id]' prêts à concaténer ; c'est toujours une suite contiguë de la fin de
+l'historique (alimenté par server._broadcast_group_message, seul chemin d'écriture de
+group_messages, et rechargé depuis la base après un défaut).
+Plafond global MAX_BYTES : les groupes les moins récemment utilisés sont évincés (LRU).
+page() renvoie None si la page demandée sort de l'anneau : l'appelant lit la base.
+"""
+import bisect
+import json
+import sys
+import threading
+from collections import OrderedDict
+
+LINES = 1000                     # messages gardés par groupe
+MAX_BYTES = 32 * 1024 * 1024     # plafond global (éléments + page récente déjà assemblée)
+ENTRY_OVERHEAD = 44              # o par message en plus de la chaîne : id (int) + 2 cases de liste
+
+_lock = threading.Lock()
+_rings = OrderedDict()           # gid -> _Ring, du moins au plus récemment utilisé
+_bytes = 0
+hits = 0
+misses = 0
+evictions = 0
+
+class _Ring:
+    __slots__ = ("ids", "items", "size", "complete", "recent")
+
+    def __init__(self, complete: bool):
+        self.ids = []            # ids croissants
+        self.items = []          # éléments JSON correspondants
+        self.size = 0
+        self.complete = complete # l'anneau contient tout l'historique du groupe
+        self.recent = None       # (n, texte) : dernière page récente assemblée
+
+def _item(mid: int, line: str) -> str:
+    return json.dumps([line, mid])
+
+def _cost(item: str) -> int:
+    return sys.getsizeof(item) + ENTRY_OVERHEAD
+
+def _forget_recent(r: _Ring):
+    global _bytes
+    if r.recent is not None:
+        _bytes -= sys.getsizeof(r.recent[1])
+        r.recent = None
+
+def _trim(r: _Ring):
+    """au-delà de LINES : les plus anciens sortent, l'anneau n'est plus complet"""
+    global _bytes
+    extra = len(r.items) - LINES
+    if extra <= 0:
+        return
+    freed = sum(_cost(it) for it in r.items[:extra])
+    del r.ids[:extra]
+    del r.items[:extra]
+    r.size -= freed
+    _bytes -= freed
+    r.complete = False
+
+def _evict():
+    global _bytes, evictions
+    while _bytes > MAX_BYTES and len(_rings) > 1:
+        _, r = _rings.popitem(last=False)
+        _bytes -= r.size + (sys.getsizeof(r.recent[1]) if r.recent else 0)
+        evictions += 1
+
+# ---------- Écriture ----------
+def create(gid: int):
+    """groupe neuf : historique vide, donc complet"""
+    with _lock:
+        if gid not in _rings:
+            _rings[gid] = _Ring(True)
+
+def append(gid: int, mid: int, line: str):
+    """message mid diffusé au groupe (après son insertion en base)"""
+    global _bytes
+    item = _item(mid, line)
+    cost = _cost(item)
+    with _lock:
+        r = _rings.get(gid)
+        if r is None:
+            # rien de plus ancien en mémoire : suite contiguë qui démarre ici
+            r = _rings[gid] = _Ring(False)
+        else:
+            _rings.move_to_end(gid)
+        # deux diffusions concurrentes peuvent arriver dans le désordre ; doublon après fill()
+        i = bisect.bisect_left(r.ids, mid)
+        if i < len(r.ids) and r.ids[i] == mid:
+            return
+        r.ids.insert(i, mid)
+        r.items.insert(i, item)
+        r.size += cost
+        _bytes += cost
+        _forget_recent(r)
+        _trim(r)
+        _evict()
+
+def fill(gid: int, rows: list, complete: bool):
+    """
+    Recharge l'anneau depuis la base : rows = [(id, ligne), ...] croissants, fin de l'historique.
+    Les messages diffusés pendant la lecture (ids plus grands) sont conservés.
+    """
+    global _bytes
+    fresh = _Ring(complete)
+    fresh.ids = [mid for mid, _ in rows]
+    fresh.items = [_item(mid, line) for mid, line in rows]
+    with _lock:
+        old = _rings.pop(gid, None)
+        if old is not None:
+            _forget_recent(old)
+            _bytes -= old.size
+            last = fresh.ids[-1] if fresh.ids else 0
+            i = bisect.bisect_right(old.ids, last)
+            fresh.ids += old.ids[i:]
+            fresh.items += old.items[i:]
+        fresh.size = sum(_cost(it) for it in fresh.items)
+        _bytes += fresh.size
+        _rings[gid] = fresh
+        _trim(fresh)
+        _evict()
+
+def drop(gid: int | None = None):
+    """oublie un groupe (ou tout le cache : purge de rétention, redémarrage)"""
+    global _bytes
+    with _lock:
+        if gid is None:
+            _rings.clear()
+            _bytes = 0
+            return
+        r = _rings.pop(gid, None)
+        if r is not None:
+            _bytes -= r.size + (sys.getsizeof(r.recent[1]) if r.recent else 0)
+
+# ---------- Instantané ----------
+def export() -> dict:
+    """anneaux {gid: (ids, éléments, complet)} du moins au plus récemment utilisé (snapshot.py)"""
+    with _lock:
+        return {gid: (list(r.ids), list(r.items), r.complete) for gid, r in _rings.items()}
+
+def restore(state: dict):
+    """recharge des anneaux exportés (cache vide, au démarrage) ; plafond MAX_BYTES appliqué"""
+    global _bytes
+    with _lock:
+        for gid, (ids, items, complete) in state.items():
+            r = _Ring(complete)
+            r.ids, r.items = list(ids), list(items)
+            r.size = sum(_cost(it) for it in r.items)
+            _bytes += r.size
+            _rings[gid] = r
+            _trim(r)
+        _evict()
+
+# ---------- Lecture ----------
+def page(gid: int, before: int | None, n: int) -> str | None:
+    """
+    Tableau JSON des n messages précédant l'id before (None : les plus récents),
+    ou None (défaut) si l'anneau ne couvre pas la page.
+    """
+    global hits, misses, _bytes
+    with _lock:
+        r = _rings.get(gid)
+        if r is None:
+            misses += 1
+            return None
+        if before is None and r.recent is not None and r.recent[0] == n:
+            hits += 1
+            _rings.move_to_end(gid)
+            return r.recent[1]
+        end = len(r.ids) if before is None else bisect.bisect_left(r.ids, before)
+        start = end - n
+        if start < 0:
+            if not r.complete:
+                misses += 1
+                return None
+            start = 0
+        hits += 1
+        _rings.move_to_end(gid)
+        text = "[" + ",".join(r.items[start:end]) + "]"
+        if before is None:
+            _forget_recent(r)
+            r.recent = (n, text)
+            _bytes += sys.getsizeof(text)
+            _evict()
+        return text
+
+def stats() -> dict:
+    with _lock:
+        return {"hits": hits, "misses": misses, "evictions": evictions,
+                "groups": len(_rings), "bytes": _bytes, "max_bytes": MAX_BYTES}
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Profilage à la demande du serveur, désactivé par défaut.
+
+Désactivé : un seul test de booléen par paquet, le verrou global est le threading.Lock d'origine.
+Activé (server.set_profiling(True), ou SIGUSR1 sous POSIX) :
+  - cProfile + durée murale par commande (type de paquet traité, "flush" pour les écritures),
+  - attente / détention du verrou global `lock`, par fonction appelante (ProfiledLock),
+  - tracemalloc : instantanés mémoire (top des allocations, octets par session).
+dump() (ou SIGUSR2) écrit tout dans profiles/<horodatage>/ puis repart de zéro.
+"""
+import cProfile
+import io
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+
+DUMP_DIR = "profiles"
+TRACE_FRAMES = 1             # profondeur de pile gardée par tracemalloc (1 = la ligne d'allocation)
+TOP = 30                     # lignes par section des rapports texte
+
+ENABLED = False
+
+_stats_lock = threading.Lock()
+_profilers = {}              # (commande, id du thread) -> cProfile.Profile (cProfile n'est pas partageable entre threads)
+_busy = set()                # profilers en cours d'utilisation
+_timings = {}                # commande -> [appels, durée totale, durée max]
+_locks = {}                  # appelant -> [acquisitions, attente totale, attente max, détention totale, détention max]
+_last_snapshot = None        # (snapshot tracemalloc, sessions) du dump précédent
+
+# ---------- Bascule ----------
+def enable():
+    global ENABLED
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACE_FRAMES)
+    ENABLED = True
+
+def disable():
+    global ENABLED, _last_snapshot
+    ENABLED = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _last_snapshot = None
+
+def install_signals(toggle, dump) -> bool:
+    """SIGUSR1 -> toggle(), SIGUSR2 -> dump() ; POSIX seulement, depuis le thread principal"""
+    if not hasattr(signal, "SIGUSR1"):
+        return False
+    signal.signal(signal.SIGUSR1, lambda signum, frame: toggle())
+    signal.signal(signal.SIGUSR2, lambda signum, frame: dump())
+    return True
+
+# ---------- Commandes ----------
+def run(command: str, fn, *args):
+    """
+    Appelle fn(*args) sous cProfile et compte sa durée dans les statistiques de command.
+    Python >= 3.12 : un seul cProfile actif par processus (sys.monitoring) ; si un autre
+    thread profile déjà, l'appel n'est que chronométré (seules les erreurs de fn remontent).
+    """
+    key = (command, threading.get_ident())
+    with _stats_lock:
+        prof = _profilers.get(key)
+        if prof is None:
+            prof = _profilers[key] = cProfile.Profile()
+        _busy.add(prof)
+    t0 = time.perf_counter()
+    try:
+        prof.enable()
+    except ValueError:
+        with _stats_lock:
+            _busy.discard(prof)
+        prof = None
+    try:
+        return fn(*args)
+    finally:
+        if prof is not None:
+            prof.disable()
+        dt = time.perf_counter() - t0
+        with _stats_lock:
+            _busy.discard(prof)
+            st = _timings.get(command)
+            if st is None:
+                st = _timings[command] = [0, 0.0, 0.0]
+            st[0] += 1
+            st[1] += dt
+            st[2] = max(st[2], dt)
+
+# ---------- Verrou ----------
+class ProfiledLock:
+    """
+    Enveloppe le verrou global pendant le profilage : même verrou sous-jacent (l'exclusion
+    est conservée pendant la bascule), temps d'attente et de détention par fonction appelante.
+    """
+    def __init__(self, inner):
+        self.inner = inner
+        self._held = threading.local()
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        return self._acquire(sys._getframe(1).f_code.co_name, blocking, timeout)
+
+    def __enter__(self):
+        self._acquire(sys._getframe(1).f_code.co_name, True, -1)
+        return self
+
+    def _acquire(self, site: str, blocking: bool, timeout: float) -> bool:
+        t0 = time.perf_counter()
+        ok = self.inner.acquire(blocking, timeout)
+        t1 = time.perf_counter()
+        if ok:
+            self._held.value = (site, t1, t1 - t0)
+        return ok
+
+    def release(self):
+        site, t1, wait = self._held.value
+        self.inner.release()
+        hold = time.perf_counter() - t1
+        with _stats_lock:
+            st = _locks.get(site)
+            if st is None:
+                st = _locks[site] = [0, 0.0, 0.0, 0.0, 0.0]
+            st[0] += 1
+            st[1] += wait
+            st[2] = max(st[2], wait)
+            st[3] += hold
+            st[4] = max(st[4], hold)
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def locked(self) -> bool:
+        return self.inner.locked()
+
+# ---------- Dump ----------
+def _take():
+    """récupère les statistiques accumulées et repart de zéro"""
+    global _profilers, _timings, _locks
+    with _stats_lock:
+        profilers, timings, locks = _profilers, _timings, _locks
+        _profilers, _timings, _locks = {}, {}, {}
+    # attendre la fin des appels encore sous cProfile avec les anciens profilers
+    end = time.monotonic() + 1.0
+    while time.monotonic() < end:
+        with _stats_lock:
+            if not _busy.intersection(profilers.values()):
+                break
+        time.sleep(0.01)
+    return profilers, timings, locks
+
+def _write_commands(directory: str, profilers: dict, timings: dict):
+    merged = {}
+    for (command, _), prof in profilers.items():
+        if not prof.getstats():
+            continue            # jamais activé (appels seulement chronométrés)
+        if command in merged:
+            merged[command].add(prof)
+        else:
+            merged[command] = pstats.Stats(prof)
+    with open(os.path.join(directory, "commands.txt"), "w", encoding="utf-8") as f:
+        f.write(f"{'commande':<16}{'appels':>10}{'total ms':>12}{'moy µs':>12}{'max ms':>10}\n")
+        for command, (n, total, worst) in sorted(timings.items(), key=lambda kv: -kv[1][1]):
+            f.write(f"{command:<16}{n:>10}{total * 1e3:>12.1f}{total / n * 1e6:>12.1f}{worst * 1e3:>10.2f}\n")
+        for command, stats in sorted(merged.items()):
+            # fichier .prof : relisible avec pstats / snakeviz
+            stats.dump_stats(os.path.join(directory, f"cmd-{command}.prof"))
+            out = io.StringIO()
+            stats.stream = out
+            stats.sort_stats("cumulative").print_stats(TOP)
+            f.write(f"\n===== {command} =====\n{out.getvalue()}")
+
+def _write_locks(directory: str, locks: dict):
+    with open(os.path.join(directory, "locks.txt"), "w", encoding="utf-8") as f:
+        f.write(f"{'appelant':<28}{'acq':>9}{'attente ms':>12}{'att max ms':>12}{'détention ms':>14}{'dét max ms':>12}\n")
+        for site, (n, wait, wmax, hold, hmax) in sorted(locks.items(), key=lambda kv: -(kv[1][1] + kv[1][3])):
+            f.write(f"{site:<28}{n:>9}{wait * 1e3:>12.2f}{wmax * 1e3:>12.3f}{hold * 1e3:>14.2f}{hmax * 1e3:>12.3f}\n")
+
+def _write_memory(directory: str, sessions: int):
+    global _last_snapshot
+    path = os.path.join(directory, "memory.txt")
+    if not tracemalloc.is_tracing():
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("tracemalloc inactif (profilage désactivé)\n")
+        return
+    snap = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+    snap.dump(os.path.join(directory, "memory.snap"))
+    stats = snap.statistics("lineno")
+    total = sum(s.size for s in stats)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"mémoire tracée : {total / 1024:.1f} Kio, sessions : {sessions}")
+        f.write(f", {total / sessions:.0f} o / session\n" if sessions else "\n")
+        if _last_snapshot is not None:
+            prev, prev_sessions = _last_snapshot
+            diff = snap.compare_to(prev, "lineno")
+            grown = sum(d.size_diff for d in diff)
+            f.write(f"\ndepuis le dump précédent : {grown / 1024:+.1f} Kio, sessions {sessions - prev_sessions:+d}")
+            if sessions != prev_sessions:
+                f.write(f", {grown / (sessions - prev_sessions):.0f} o / session ajoutée")
+            f.write("\n")
+            for d in diff[:TOP]:
+                f.write(f"  {d}\n")
+        f.write("\ntop des allocations :\n")
+        for s in stats[:TOP]:
+            f.write(f"  {s}\n")
+    _last_snapshot = (snap, sessions)
+
+def dump(directory: str | None = None, sessions: int = 0) -> str:
+    """écrit commands.txt (+ cmd-*.prof), locks.txt, memory.txt (+ memory.snap) ; renvoie le dossier"""
+    if directory is None:
+        now = time.time()
+        directory = os.path.join(DUMP_DIR, time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"-{int(now * 1000) % 1000:03d}")
+    os.makedirs(directory, exist_ok=True)
+    # instantané mémoire d'abord : la fusion des stats cProfile alloue beaucoup
+    _write_memory(directory, sessions)
+    profilers, timings, locks = _take()
+    _write_commands(directory, profilers, timings)
+    _write_locks(directory, locks)
+    return directory
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Rejeu d'une capture (capture.py) contre un serveur neuf : latence par commande et débit.
+
+    python server.py --capture trafic.icap              # capture (Ctrl-C ferme proprement le fichier)
+    python replay.py run trafic.icap --speed 10 --out a.json
+    python replay.py run trafic.icap --server ../autre/server.py --out b.json
+    python replay.py diff a.json b.json
+    python replay.py run trafic.icap --compare ../autre/server.py   # les deux d'affilée + diff
+
+Chaque build est lancé en sous-processus (--db :memory:, port libre, dossier temporaire).
+Latence d'une commande : elle est envoyée suivie d'un "@ping" ; le "@pong" revient une fois
+la commande traitée (même connexion, dans l'ordre). Login : jusqu'au paquet "@groups/".
+--speed 1 : temps réel, 10 : dix fois plus vite, 0 : sans attente (débit max).
+"""
+import argparse
+import json
+import os
+import selectors
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+
+import capture
+
+ENC = "utf-8"
+PASSWORD = "replay"
+LOGIN_TIMEOUT = 10.0         # s pour qu'une session rejouée soit connectée
+DRAIN_TIMEOUT = 30.0         # s pour recevoir les derniers "@pong"
+
+# ---------- Serveur ----------
+def _cpu_seconds(pid: int):
+    """utime + stime du processus (None hors Linux)"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except OSError:
+        return None
+
+def _free_port() -> int:
+    """port libre dont le suivant (serveur de fichiers) l'est aussi"""
+    while True:
+        with socket.socket() as a:
+            a.bind(("127.0.0.1", 0))
+            port = a.getsockname()[1]
+            with socket.socket() as b:
+                try:
+                    b.bind(("127.0.0.1", port + 1))
+                    return port
+                except OSError:
+                    continue
+
+def _start_server(path: str) -> tuple[subprocess.Popen, int]:
+    port = _free_port()
+    proc = subprocess.Popen([sys.executable, os.path.abspath(path), "--host", "127.0.0.1",
+                             "--port", str(port), "--db", ":memory:"],
+                            cwd=tempfile.mkdtemp(prefix="replay_"),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    end = time.monotonic() + 10
+    while time.monotonic() < end:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return proc, port
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError(f"{path}: serveur injoignable")
+
+# ---------- Rejeu ----------
+class _Session:
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.buf = bytearray()
+        self.waiting = deque()       # (op, t0) en attente d'un "@pong"
+        self.ready = threading.Event()
+        self.login_t0 = time.perf_counter()
+        self.send_lock = threading.Lock()    # le lecteur répond aux "@ping" sur la même socket
+
+    def send(self, data: bytes):
+        with self.send_lock:
+            self.sock.sendall(data)
+
+class Replayer:
+    def __init__(self, port: int):
+        self.port = port
+        self.sessions = {}           # id de session capturée -> _Session
+        self.known = set()           # noms déjà inscrits sur le serveur rejoué
+        self.samples = {}            # op -> [latences]
+        self.skipped = 0
+        self.sel = selectors.DefaultSelector()
+        self.stop = threading.Event()
+
+    def _sample(self, op: str, dt: float):
+        self.samples.setdefault(op, []).append(dt)
+
+    def reader(self):
+        while not self.stop.is_set():
+            for key, _ in self.sel.select(0.01):
+                s = key.data
+                try:
+                    data = s.sock.recv(65536)
+                except OSError:
+                    data = b""
+                if not data:
+                    self._forget(s)
+                    continue
+                s.buf += data
+                *lines, rest = bytes(s.buf).split(b"\n")
+                s.buf[:] = rest
+                now = time.perf_counter()
+                for line in lines:
+                    if line == b"@pong" and s.waiting:
+                        op, t0 = s.waiting.popleft()
+                        self._sample(op, now - t0)
+                    elif line == b"@ping":
+                        # heartbeat du serveur : répondu ici (les "pong" capturés sont ignorés)
+                        try:
+                            s.send(b"@pong\n")
+                        except OSError:
+                            pass
+                    elif line.startswith(b"@groups/") and not s.ready.is_set():
+                        self._sample("login", now - s.login_t0)
+                        s.ready.set()
+
+    def _forget(self, s: _Session):
+        try:
+            self.sel.unregister(s.sock)
+        except (KeyError, ValueError):
+            pass
+        s.waiting.clear()
+
+    def _login(self, sid: int, name: str):
+        sock = socket.create_connection(("127.0.0.1", self.port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        s = self.sessions[sid] = _Session(sock)
+        self.sel.register(sock, selectors.EVENT_READ, s)
+        if name in self.known:
+            s.send(f"{name}/{PASSWORD}\n".encode(ENC))
+        else:
+            self.known.add(name)
+            s.send(f"{name}/{PASSWORD}/{name}@replay/{PASSWORD}\n".encode(ENC))
+
+    def _synth(self, op: str, size: int, payload):
+        """paquet à rejouer ; capture sans contenu : paquet de même taille quand c'est possible"""
+        if payload is not None:
+            return payload
+        if op == "ping":
+            return "@ping"
+        if op == "list":
+            return "list/new/list"
+        if op == "historique":
+            return "Historique"
+        if op in ("g", "group_text"):
+            return "x" * max(size, 1)        # texte brut -> groupe courant
+        if op == "dm" and self.known:
+            target = next(iter(self.known))
+            return "x" * max(size - len(target) - 1, 1) + "/" + target
+        return None
+
+    def run(self, records: list, speed: float) -> float:
+        threading.Thread(target=self.reader, daemon=True).start()
+        t_start = time.perf_counter()
+        for ts, sid, op, size, payload in records:
+            if speed:
+                delay = t_start + ts / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            if op == "login":
+                try:
+                    self._login(sid, payload or f"s{sid}")
+                except OSError:
+                    self.skipped += 1
+                continue
+            if op == "pong":
+                continue
+            s = self.sessions.get(sid)
+            if s is None or not s.ready.wait(LOGIN_TIMEOUT):
+                self.skipped += 1
+                continue
+            if op == "close":
+                # laisser revenir les réponses en vol avant de couper (sinon perdues en --speed 0)
+                end = time.monotonic() + DRAIN_TIMEOUT
+                while s.waiting and time.monotonic() < end:
+                    time.sleep(0.001)
+                self._forget(s)
+                s.sock.close()
+                del self.sessions[sid]
+                continue
+            line = self._synth(op, size, payload)
+            if line is None:
+                self.skipped += 1
+                continue
+            if op == "rename":
+                self.known.add(line.split("!", 1)[0])
+            # la commande puis un "@ping" : le "@pong" date la fin de son traitement
+            data = b"@ping\n" if op == "ping" else f"{line}\n@ping\n".encode(ENC)
+            s.waiting.append((op, time.perf_counter()))
+            try:
+                s.send(data)
+            except OSError:
+                self.skipped += 1
+        # attendre les dernières réponses
+        end = time.monotonic() + DRAIN_TIMEOUT
+        while any(s.waiting for s in list(self.sessions.values())) and time.monotonic() < end:
+            time.sleep(0.01)
+        wall = time.perf_counter() - t_start
+        self.stop.set()
+        for s in self.sessions.values():
+            s.sock.close()
+        return wall
+
+def _percentile(values: list, q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def replay(capture_path: str, server_path: str, speed: float) -> dict:
+    mode, records = capture.read(capture_path)
+    proc, port = _start_server(server_path)
+    try:
+        cpu0 = _cpu_seconds(proc.pid)
+        r = Replayer(port)
+        wall = r.run(records, speed)
+        cpu1 = _cpu_seconds(proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait()
+    ops = {}
+    for op, values in sorted(r.samples.items()):
+        values.sort()
+        ops[op] = {"n": len(values), "mean": sum(values) / len(values), "p50": _percentile(values, 0.5),
+                   "p95": _percentile(values, 0.95), "p99": _percentile(values, 0.99), "max": values[-1]}
+    done = sum(o["n"] for o in ops.values())
+    return {"server": os.path.abspath(server_path), "capture": os.path.abspath(capture_path),
+            "mode": mode, "speed": speed, "records": len(records), "replayed": done,
+            "skipped": r.skipped, "wall": wall, "throughput": done / wall if wall else 0.0,
+            "server_cpu": None if cpu0 is None else cpu1 - cpu0, "ops": ops}
+
+# ---------- Rapports ----------
+def print_report(rep: dict):
+    print(f"{rep['server']}  ({rep['replayed']}/{rep['records']} commandes, {rep['skipped']} ignorées)")
+    cpu = f", CPU serveur {rep['server_cpu']:.3f} s" if rep["server_cpu"] is not None else ""
+    print(f"mur {rep['wall']:.3f} s, {rep['throughput']:,.0f} commandes/s{cpu}")
+    print(f"{'commande':<14}{'n':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for op, o in rep["ops"].items():
+        print(f"{op:<14}{o['n']:>8}{o['p50'] * 1e3:>10.3f}{o['p95'] * 1e3:>10.3f}"
+              f"{o['p99'] * 1e3:>10.3f}{o['max'] * 1e3:>10.3f}")
+
+def _delta(a: float, b: float) -> str:
+    return f"{(b - a) / a:+.0%}" if a else "  n/a"
+
+def print_diff(a: dict, b: dict):
+    print(f"A = {a['server']}\nB = {b['server']}")
+    print(f"débit : {a['throughput']:,.0f} -> {b['throughput']:,.0f} commandes/s ({_delta(a['throughput'], b['throughput'])})")
+    if a["server_cpu"] and b["server_cpu"] is not None:
+        print(f"CPU serveur : {a['server_cpu']:.3f} -> {b['server_cpu']:.3f} s ({_delta(a['server_cpu'], b['server_cpu'])})")
+    print(f"{'commande':<14}{'p50 A':>9}{'p50 B':>9}{'Δ':>7}{'p95 A':>9}{'p95 B':>9}{'Δ':>7}{'p99 A':>9}{'p99 B':>9}{'Δ':>7}")
+    for op in sorted(set(a["ops"]) | set(b["ops"])):
+        oa, ob = a["ops"].get(op), b["ops"].get(op)
+        if oa is None or ob is None:
+            print(f"{op:<14}  absente de {'A' if oa is None else 'B'}")
+            continue
+        cells = []
+        for q in ("p50", "p95", "p99"):
+            cells.append(f"{oa[q] * 1e3:>9.3f}{ob[q] * 1e3:>9.3f}{_delta(oa[q], ob[q]):>7}")
+        print(f"{op:<14}" + "".join(cells))
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    run = sub.add_parser("run", help="rejouer une capture")
+    run.add_argument("capture")
+    run.add_argument("--server", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py"))
+    run.add_argument("--speed", type=float, default=1.0)
+    run.add_argument("--out", help="rapport JSON")
+    run.add_argument("--compare", help="second server.py à rejouer ensuite, puis diff")
+    diff = sub.add_parser("diff", help="comparer deux rapports JSON")
+    diff.add_argument("a")
+    diff.add_argument("b")
+    args = ap.parse_args()
+
+    if args.cmd == "diff":
+        with open(args.a) as fa, open(args.b) as fb:
+            print_diff(json.load(fa), json.load(fb))
+        return
+    rep = replay(args.capture, args.server, args.speed)
+    print_report(rep)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(rep, f, indent=1)
+    if args.compare:
+        other = replay(args.capture, args.compare, args.speed)
+        print()
+        print_report(other)
+        print()
+        print_diff(rep, other)
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,184 @@
 # -*- coding: utf-8 -*-
 import json
+import os
+import secrets
+import signal
 import socket
+import ssl
+import sys
 import threading
 import sqlite3
 import time
+from array import array
+from bisect import bisect_left, insort
+from collections import deque
+from contextlib import contextmanager
+from itertools import islice
+
+import archive
+import capture
+import filestore
+import history_cache
+import profiling
+import snapshot
+import tls
 
 # ---------- Réseau ----------
-SERVER_IP = socket.gethostbyname(socket.gethostname())
+SERVER_IP = None             # None = IP de la machine (résolue au démarrage, pas à l'import)
 SERVER_PORT = 12345
 ENC = "utf-8"
+MAX_PACKET = 1024 * 1024     # octets max d'un paquet entrant (au-delà : connexion coupée)
+
+# TLS optionnel : renseigner les deux chemins PEM (voir tls.py, make_test_ca pour essayer)
+TLS_CERT = None
+TLS_KEY = None
 
-server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-server.bind((SERVER_IP, SERVER_PORT))
-server.listen()
-print("listening on", SERVER_IP, SERVER_PORT)
+# posés par ChatServer.start() (rien n'est ouvert à l'import : module embarquable)
+server = None                # socket d'écoute du chat
+tls_ctx = None
+_stop = threading.Event()    # arrêt des threads de fond (flusher, reaper, archiver)
+_running = None              # ChatServer démarré (l'état du module n'en porte qu'un)
 
 # ---------- État en mémoire ----------
-clients = []                 # sockets alignées avec "names"
-names = []                   # noms alignés avec "clients"
+# Objets à __slots__ (pas de __dict__ par instance), noms internés (une seule copie par nom
+# quel que soit le nombre de sessions / groupes qui le référencent), membres en ids entiers.
+# bench_memory.py mesure le coût par connexion et par appartenance à un groupe.
+# Pile des threads en processus dédié (serve_forever) ; None = défaut du système. Ne pas la
+# réduire : json / sqlite récursent sur la pile C, une petite pile transforme un paquet très
+# imbriqué en SIGSEGV (Python 3.13) au lieu d'une RecursionError rattrapée par le handler.
+THREAD_STACK = None
+
+class Session:
+    """connexion authentifiée"""
+    __slots__ = ("sock", "name", "gids", "current_gid", "last_seen")
+
+    def __init__(self, sock: socket.socket, name: str):
+        self.sock = sock
+        self.name = sys.intern(name)
+        self.gids = ()                       # groupes (array "I" dès le premier ; () partagé sinon)
+        self.current_gid = None              # groupe des messages "texte brut" sans gid
+        self.last_seen = time.monotonic()    # dernier paquet reçu (heartbeat / reaper)
+
+class Group:
+    """groupe du registre ; membres = ids utilisateur triés (4 octets par membre)"""
+    __slots__ = ("admin", "members")
+
+    def __init__(self, admin: str, uids):
+        self.admin = sys.intern(admin)
+        self.members = array("I", sorted(set(uids)))
+
+    def has(self, uid: int) -> bool:
+        i = bisect_left(self.members, uid)
+        return i < len(self.members) and self.members[i] == uid
+
+    def add(self, uid: int) -> bool:
+        if self.has(uid):
+            return False
+        insort(self.members, uid)
+        return True
+
+sessions = {}                # socket -> Session
+by_name = {}                 # nom -> Session connectée
 
-# group_id -> {"admin": str, "members": set[str]}
+# group_id -> Group (registre chargé à la demande)
 groups = {}
 
-# user -> current_group_id (pour router les messages "texte brut")
-current_group_by_user = {}
+# index de diffusion : gid -> {sockets connectées}
+group_online = {}
 
-lock = threading.Lock()
+# nom -> id entier (propre au processus, attribué au premier usage, conservé au renommage)
+user_ids = {}
+_next_uid = 1
+
+# annuaire : noms de tous les comptes, triés (réponses signin / signup / liste des utilisateurs)
+accounts = []
+_accounts_ready = False     # chargé depuis la base (ou l'instantané) au premier usage
+_accounts_gen = 0           # modifications depuis le démarrage (chargement concurrent)
+_accounts_reply = None      # " /nom1/nom2..." déjà assemblé
+
+# écritures "base puis mémoire" en cours (instantané seulement quand il n'y en a aucune)
+_inflight = 0
+
+lock = threading.Lock()      # enveloppé par profiling.ProfiledLock pendant le profilage
+
+def _uid(name: str) -> int:
+    """id entier de name (appeler sous lock)"""
+    global _next_uid
+    uid = user_ids.get(name)
+    if uid is None:
+        uid = user_ids[sys.intern(name)] = _next_uid
+        _next_uid += 1
+    return uid
+
+@contextmanager
+def _writing():
+    """
+    Encadre un commit suivi de sa mise à jour mémoire : un instantané pris entre les deux
+    porterait le compteur de la base sans l'effet en mémoire (voir save_snapshot).
+    """
+    global _inflight
+    with lock:
+        _inflight += 1
+    try:
+        yield
+    finally:
+        with lock:
+            _inflight -= 1
+
+def _current_gid(nom: str):
+    s = by_name.get(nom)
+    return s.current_gid if s is not None else None
+
+# ---------- Écriture ----------
+# Chaque paquet est encodé une seule fois (bytes immuables partagés par tous les destinataires),
+# mis en file par connexion, puis un thread "flusher" vide les files par tick avec sendmsg
+# (écriture vectorisée : plusieurs paquets en un appel système).
+# Sans envoi non bloquant possible (TLS, pas de sendmsg / MSG_DONTWAIT) chaque connexion a
+# son écrivain : une écriture bloquée ne retient qu'elle, le flusher applique MAX_PENDING.
+FLUSH_TICK = 0.001           # s : fenêtre de coalescence des écritures
+MAX_PENDING = 4 * 1024 * 1024  # octets en attente max par connexion (client trop lent -> coupé)
+IOV_MAX = 1024               # paquets max par sendmsg
+
+outq = {}                    # socket -> deque[bytes | memoryview]
+pending = {}                 # socket -> octets en attente
+dirty = set()                # sockets ayant des paquets en attente
+writers = {}                 # socket -> Event de réveil de son écrivain (connexions bloquantes)
+out_lock = threading.Lock()
+out_cv = threading.Condition(out_lock)
+
+# envoi non bloquant sans toucher au mode de la socket (lue en bloquant par son thread)
+_VECTORED = hasattr(socket.socket, "sendmsg") and hasattr(socket, "MSG_DONTWAIT")
+
+# ---------- Heartbeat ----------
+HEARTBEAT_INTERVAL = 15.0    # s de silence avant d'envoyer un "@ping" au client
+IDLE_TIMEOUT = 45.0          # s de silence avant de considérer la session morte
+REAP_INTERVAL = 5.0          # période du reaper
+
+# ---------- Reprise de session ----------
+SESSION_TTL = 7 * 24 * 3600  # durée de vie d'un jeton de reprise (s)
+SEQ = "\x1f"                # séparateur du tag "conv/id" ajouté aux messages live
+
+# ---------- Rétention ----------
+ARCHIVE_INTERVAL = 3600.0    # période de la passe d'archivage (voir archive.py)
+
+# ---------- Instantané ----------
+SNAPSHOT_INTERVAL = 300.0    # s entre deux instantanés (et à l'arrêt propre), voir snapshot.py
+
+# ---------- Historique ----------
+HISTORY_PAGE = 500           # messages par page d'historique (récents : cache mémoire, voir history_cache.py)
 
 # ---------- SQLite ----------
 DB = "MyData1.db"
 
+# PRAGMA user_version : une base à jour démarre sans rejouer schéma ni migrations
+SCHEMA_VERSION = 5
+
+def _db() -> sqlite3.Connection:
+    """connexion à DB (chemin ou URI "file:", ex. base en mémoire d'un serveur embarqué)"""
+    return sqlite3.connect(DB, uri=DB.startswith("file:"))
+
 def init_db():
-    with sqlite3.connect(DB) as conn:
+    with _db() as conn:
         cur = conn.cursor()
         cur.execute("""CREATE TABLE IF NOT EXISTS client(
             nom TEXT PRIMARY KEY,
@@ -56,10 +203,44 @@ def init_db():
             group_id INTEGER,
             member TEXT
         )""")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_group_members_member ON group_members(member)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_group_members_group ON group_members(group_id)")
+        # pages d'historique : (group_id, rowid) sans parcourir les autres groupes
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_group_messages_group ON group_messages(group_id)")
+        cur.execute("""CREATE TABLE IF NOT EXISTS sessions(
+            token TEXT PRIMARY KEY,
+            nom TEXT,
+            expires REAL
+        )""")
+        # conversations matérialisées (liste du login sans parcourir l'historique) :
+        #   "d:<nom>" : dernier id / ts et non-lus, tenus à jour à chaque DM
+        #   "g:<gid>" : read_seq seulement ; dernier id / ts / compteur dans group_stats
+        #               (une écriture par message de groupe, pas une par membre)
+        cur.execute("""CREATE TABLE IF NOT EXISTS conversations(
+            nom TEXT,
+            conv TEXT,
+            last_id INTEGER,
+            last_ts REAL,
+            unread INTEGER DEFAULT 0,
+            read_seq INTEGER DEFAULT 0,
+            PRIMARY KEY(nom, conv)
+        ) WITHOUT ROWID""")
+        cur.execute("""CREATE TABLE IF NOT EXISTS group_stats(
+            gid INTEGER PRIMARY KEY,
+            last_id INTEGER,
+            last_ts REAL,
+            seq INTEGER
+        )""")
+        # renommages, dans l'ordre : la reprise reporte le dernier id vu de "d:<ancien>" sur le nouveau nom
+        cur.execute("""CREATE TABLE IF NOT EXISTS renames(
+            id INTEGER PRIMARY KEY,
+            old TEXT,
+            new TEXT
+        )""")
         conn.commit()
 
 def migrate_add_ts_columns():
-    with sqlite3.connect(DB) as conn:
+    with _db() as conn:
         cur = conn.cursor()
 
         # messages: ajouter ts si manquant
@@ -78,42 +259,417 @@ def migrate_add_ts_columns():
             cur.execute("UPDATE group_messages SET ts = rowid")
             conn.commit()
 
-init_db()
-migrate_add_ts_columns()
+def migrate_conversations():
+    """remplit conversations / group_stats depuis l'historique existant (tout compte comme lu)"""
+    with _db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT OR IGNORE INTO conversations(nom, conv, last_id, last_ts)
+            SELECT nom, 'd:' || peer, MAX(id), MAX(ts) FROM (
+                SELECT nomdestination AS nom, nomemetteur AS peer, rowid AS id, ts FROM messages
+                UNION ALL
+                SELECT nomemetteur, nomdestination, rowid, ts FROM messages
+            ) GROUP BY nom, peer
+        """)
+        cur.execute("""
+            INSERT OR IGNORE INTO group_stats(gid, last_id, last_ts, seq)
+            SELECT group_id, MAX(rowid), MAX(ts), COUNT(*) FROM group_messages GROUP BY group_id
+        """)
+        cur.execute("""
+            INSERT OR IGNORE INTO conversations(nom, conv, read_seq)
+            SELECT m.member, 'g:' || m.group_id, s.seq
+            FROM group_members m JOIN group_stats s ON s.gid = m.group_id
+        """)
+        conn.commit()
+
+def prepare_db():
+    """
+    Vérification de démarrage : une lecture de user_version si la base est à jour.
+    Sinon (base neuve ou ancienne) schéma + migrations + rétention, une seule fois.
+    """
+    with _db() as conn:
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+    init_db()
+    migrate_add_ts_columns()
+    migrate_conversations()
+    archive.init_retention(DB)
+    archive.enable_incremental_vacuum(DB)
+    with _db() as conn:
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+def archiver_loop(interval: float = ARCHIVE_INTERVAL):
+    while not _stop.wait(interval):
+        try:
+            with _writing():
+                archive.archive_cold(DB)
+                # la passe peut avoir purgé des messages encore en cache
+                history_cache.drop()
+        except Exception:
+            pass
+
+def _db_file() -> str | None:
+    """chemin du fichier de DB (None : base en mémoire)"""
+    if not DB.startswith("file:"):
+        return None if DB == ":memory:" else DB
+    path, _, params = DB[5:].partition("?")
+    if "memory" in params or not path or path == ":memory:":
+        return None
+    return path
+
+def _snapshot_state() -> dict:
+    """état à sauver (appeler sous lock) : types marshal seulement"""
+    return {
+        "users": dict(user_ids),
+        "next_uid": _next_uid,
+        "groups": {gid: (g.admin, g.members.tobytes()) for gid, g in groups.items()},
+        "accounts": list(accounts) if _accounts_ready else None,
+        "history": history_cache.export(),
+    }
+
+def _restore(state: dict):
+    """recharge l'état d'un instantané (serveur pas encore démarré)"""
+    global _next_uid, _accounts_ready, _accounts_reply
+    with lock:
+        user_ids.update((sys.intern(n), uid) for n, uid in state["users"].items())
+        _next_uid = state["next_uid"]
+        for gid, (admin, members) in state["groups"].items():
+            g = groups[gid] = Group(admin, ())
+            g.members.frombytes(members)
+        if state["accounts"] is not None:
+            accounts[:] = [sys.intern(n) for n in state["accounts"]]
+            _accounts_reply = None
+            _accounts_ready = True
+    history_cache.restore(state["history"])
+
+def save_snapshot(wait: float = 0.0) -> bool:
+    """
+    Écrit l'instantané à côté de la base (DB + ".snap"). L'état est copié sous lock, avec le
+    compteur de changements lu au même moment, hors de toute écriture en cours (_writing) ;
+    s'il y en a, nouvel essai pendant wait s au plus. False : pas d'instantané écrit.
+    """
+    path = _db_file()
+    if path is None:
+        return False
+    end = time.monotonic() + wait
+    while True:
+        with lock:
+            if _inflight == 0:
+                counter = snapshot.change_counter(path)
+                state = _snapshot_state() if counter is not None else None
+                break
+        if time.monotonic() >= end:
+            return False
+        time.sleep(0.01)
+    if state is None:
+        return False
+    try:
+        snapshot.write(path + ".snap", counter, SCHEMA_VERSION, state)
+    except OSError:
+        return False
+    return True
+
+def load_snapshot() -> bool:
+    """au démarrage : état de l'instantané s'il correspond à la base, sinon reconstruction à la demande"""
+    path = _db_file()
+    if path is None:
+        return False
+    state = snapshot.load(path + ".snap", snapshot.change_counter(path), SCHEMA_VERSION)
+    if state is None:
+        return False
+    try:
+        _restore(state)
+    except (KeyError, TypeError, ValueError):
+        _reset_state()       # instantané d'une autre forme : repartir vide
+        return False
+    return True
+
+def snapshot_loop(interval: float = SNAPSHOT_INTERVAL):
+    while not _stop.wait(interval):
+        save_snapshot()
 
 # ---------- Utilitaires envoi ----------
+def _frame(payload: str) -> bytes:
+    """un paquet = une ligne terminée par '\n' (le client découpe dessus)"""
+    if not payload.endswith("\n"):
+        payload += "\n"
+    return payload.encode(ENC)
+
+def _recv_packets(sock: socket.socket, buf: bytearray) -> list[str]:
+    """lit jusqu'à avoir au moins un paquet complet ; le reste reste dans buf"""
+    while b"\n" not in buf:
+        if len(buf) > MAX_PACKET:
+            raise ConnectionError("paquet trop long")
+        data = sock.recv(4096)
+        if not data:
+            raise ConnectionError
+        buf += data
+    *lines, rest = bytes(buf).split(b"\n")
+    buf[:] = rest
+    return [line.decode(ENC) for line in lines]
+
+def _enqueue(socks, data: bytes):
+    """met le même buffer (non copié) en file pour chaque socket ; le flusher (ou son écrivain) l'écrira"""
+    with out_cv:
+        for c in socks:
+            q = outq.get(c)
+            if q is None:
+                q = outq[c] = deque()
+                if not _VECTORED or isinstance(c, ssl.SSLSocket):
+                    _start_writer(c)
+            q.append(data)
+            pending[c] = pending.get(c, 0) + len(data)
+            dirty.add(c)
+            wake = writers.get(c)
+            if wake is not None:
+                wake.set()
+        out_cv.notify()
+
+def _flush_one(c: socket.socket, frames: list) -> int:
+    """écrit frames (un seul appel système) ; renvoie le nombre d'octets acceptés par le noyau"""
+    return c.sendmsg(frames, [], socket.MSG_DONTWAIT)
+
+def _start_writer(c: socket.socket):
+    """écrivain dédié de c (appeler sous out_cv)"""
+    if c not in writers:
+        wake = writers[c] = threading.Event()
+        threading.Thread(target=writer_loop, args=(c, wake), daemon=True).start()
+
+def writer_loop(c: socket.socket, wake: threading.Event):
+    """écritures bloquantes d'une connexion ; se termine quand la connexion est retirée"""
+    while True:
+        wake.wait()
+        with out_cv:
+            wake.clear()
+            if writers.get(c) is not wake:
+                return
+            q = outq.get(c)
+            frames = list(islice(q, IOV_MAX)) if q else []
+        if not frames:
+            continue
+        data = b"".join(frames)
+        try:
+            if profiling.ENABLED:
+                profiling.run("flush", c.sendall, data)
+            else:
+                c.sendall(data)
+        except OSError:
+            # socket morte (ou fermée par _drop_sessions) : le thread de lecture fera le nettoyage
+            with out_cv:
+                outq.pop(c, None)
+                pending.pop(c, None)
+                if writers.get(c) is wake:
+                    del writers[c]
+            return
+        with out_cv:
+            q = outq.get(c)
+            if q is None:
+                continue
+            # les paquets écrits sont en tête : seul l'écrivain retire de cette file
+            for _ in frames:
+                q.popleft()
+            pending[c] -= len(data)
+            if q:
+                wake.set()
+
+def flusher_loop():
+    while not _stop.is_set():
+        with out_cv:
+            while not dirty and not _stop.is_set():
+                out_cv.wait()
+        # laisser les autres threads accumuler des paquets pendant un tick
+        time.sleep(FLUSH_TICK)
+        with out_cv:
+            batch = [(c, list(islice(outq[c], IOV_MAX))) for c in dirty if outq.get(c) and c not in writers]
+            # connexions à écrivain : seulement le plafond (l'écrivain peut être bloqué dans sendall)
+            slow = [c for c in dirty if c in writers and pending.get(c, 0) > MAX_PENDING]
+            dirty.clear()
+        for c, frames in batch:
+            try:
+                if profiling.ENABLED:
+                    sent = profiling.run("flush", _flush_one, c, frames)
+                else:
+                    sent = _flush_one(c, frames)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except OSError:
+                # socket morte : le thread de lecture fera le nettoyage
+                with out_cv:
+                    outq.pop(c, None)
+                    pending.pop(c, None)
+                continue
+            with out_cv:
+                q = outq.get(c)
+                if q is None:
+                    continue
+                pending[c] -= sent
+                # retirer les paquets entièrement écrits, couper le premier partiel
+                while sent and q:
+                    head = q[0]
+                    if sent >= len(head):
+                        sent -= len(head)
+                        q.popleft()
+                    else:
+                        q[0] = memoryview(head)[sent:]
+                        sent = 0
+                if q:
+                    dirty.add(c)
+                    if pending[c] > MAX_PENDING:
+                        slow.append(c)
+        if slow:
+            _drop_sessions(slow)
+
 def _send_to_name(dst_name: str, payload: str):
     """envoie payload à UN utilisateur (si connecté)"""
+    data = _frame(payload)
     with lock:
-        for i, c in enumerate(clients):
-            if names[i] == dst_name:
-                try:
-                    c.send(payload.encode(ENC))
-                except Exception:
-                    pass
-                return
+        s = by_name.get(dst_name)
+    if s is not None:
+        _enqueue((s.sock,), data)
 
-def _broadcast_to_names(dst_names: set[str], payload: str):
-    """envoie payload à un ensemble d'utilisateurs connectés"""
+def _broadcast_to_group(gid: int, payload: str):
+    """envoie payload aux seules sessions connectées du groupe gid (encodé une seule fois)"""
+    data = _frame(payload)
     with lock:
-        for i, c in enumerate(clients):
-            if names[i] in dst_names:
-                try:
-                    c.send(payload.encode(ENC))
-                except Exception:
-                    pass
+        socks = list(group_online.get(gid, ()))
+    if socks:
+        _enqueue(socks, data)
+
+def _tag(conv: str, mid: int) -> str:
+    """suffixe "\x1f<conv>\x1f<id>" : permet au client de suivre le dernier id vu par conversation"""
+    return f"{SEQ}{conv}{SEQ}{mid}"
 
 def _send_user_list(to_name: str):
     """len==3 : envoie la liste des utilisateurs au demandeur (format attendu par le client)"""
-    with sqlite3.connect(DB) as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT DISTINCT nom FROM client")
-        all_names = [row[0] for row in cur.fetchall()]
+    all_names = _account_names()
     payload_json = json.dumps([[n] for n in all_names])  # [[name],[name],...]
     packet = f"{payload_json}/new/list"  # -> len==3 (json / 'new' / 'list')
     _send_to_name(to_name, packet)
 
+# ---------- Annuaire ----------
+def _load_accounts():
+    """annuaire depuis la base au premier usage ; tenu à jour ensuite par signup / renommage"""
+    global _accounts_ready, _accounts_reply
+    while True:
+        with lock:
+            if _accounts_ready:
+                return
+            gen = _accounts_gen
+        with _db() as conn:
+            names = [r[0] for r in conn.execute("SELECT nom FROM client ORDER BY nom")]
+        with lock:
+            if _accounts_ready:
+                return
+            # un compte créé / renommé pendant la lecture : relire
+            if gen == _accounts_gen:
+                accounts[:] = [sys.intern(n) for n in names]
+                _accounts_reply = None
+                _accounts_ready = True
+                return
+
+def _account_names() -> list[str]:
+    _load_accounts()
+    with lock:
+        return list(accounts)
+
+def _accounts_line() -> str:
+    """réponse " /nom1/nom2..." de signin / signup, assemblée une fois par version de l'annuaire"""
+    global _accounts_reply
+    _load_accounts()
+    with lock:
+        if _accounts_reply is None:
+            _accounts_reply = " " + "".join(f"/{n}" for n in accounts)
+        return _accounts_reply
+
+def _account_add(nom: str):
+    """compte créé (appeler sous lock, après le commit)"""
+    global _accounts_gen, _accounts_reply
+    _accounts_gen += 1
+    if _accounts_ready:
+        insort(accounts, sys.intern(nom))
+        _accounts_reply = None
+
+def _account_rename(old: str, new: str):
+    """compte renommé (appeler sous lock, après le commit)"""
+    global _accounts_gen, _accounts_reply
+    _accounts_gen += 1
+    if _accounts_ready:
+        i = bisect_left(accounts, old)
+        if i < len(accounts) and accounts[i] == old:
+            del accounts[i]
+        insort(accounts, new)
+        _accounts_reply = None
+
 # ---------- Groupes ----------
+def _get_group(gid: int):
+    """groupe depuis le registre mémoire, chargé depuis la DB au premier usage"""
+    with lock:
+        g = groups.get(gid)
+    if g is not None:
+        return g
+    with _db() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT admin FROM groups WHERE id=?", (gid,))
+        row = cur.fetchone()
+        if not row:
+            return None
+        cur.execute("SELECT member FROM group_members WHERE group_id=?", (gid,))
+        members = [r[0] for r in cur.fetchall()]
+    return _cache_group(gid, row[0], members)
+
+def _cache_group(gid: int, admin: str, members: list[str]) -> Group:
+    """entrée du registre pour gid (celle déjà présente si un autre thread l'a chargée)"""
+    with lock:
+        g = groups.get(gid)
+        if g is None:
+            g = groups[gid] = Group(admin, [_uid(m) for m in members])
+        return g
+
+def _load_user_groups(s: Session) -> list[tuple[int, str]]:
+    """
+    Au login : groupes de l'utilisateur (lookup indexé sur group_members.member)
+    et inscription de la session dans group_online de chacun.
+    """
+    with _db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT g.id, g.admin
+            FROM group_members m JOIN groups g ON g.id = m.group_id
+            WHERE m.member=?
+            ORDER BY g.id
+        """, (s.name,))
+        mine = cur.fetchall()
+    _attach_groups(s, [gid for gid, _ in mine])
+    return mine
+
+def _attach_groups(s: Session, gids: list[int]):
+    """inscrit la session dans group_online de ses groupes (partie mémoire du login)"""
+    with lock:
+        s.gids = array("I", gids) if gids else ()
+        for gid in gids:
+            group_online.setdefault(gid, set()).add(s.sock)
+        if gids and s.current_gid is None:
+            s.current_gid = gids[-1]
+
+def _is_member(nom: str, gid: int) -> bool:
+    with lock:
+        s = by_name.get(nom)
+        return s is not None and gid in s.gids
+
+def _join_online(gid: int, members):
+    """ajoute gid aux index des membres connectés"""
+    with lock:
+        for m in members:
+            s = by_name.get(m)
+            if s is None:
+                continue
+            if not s.gids:
+                s.gids = array("I")
+            if gid not in s.gids:
+                s.gids.append(gid)
+            group_online.setdefault(gid, set()).add(s.sock)
+            s.current_gid = gid
+
 def _create_group(admin: str, members: list[str]) -> int:
     """
     Crée un groupe: admin + members (y compris admin).
@@ -128,48 +684,54 @@ def _create_group(admin: str, members: list[str]) -> int:
     if admin not in seen:
         uniq.insert(0, admin); seen.add(admin)
 
-    with sqlite3.connect(DB) as conn:
-        cur = conn.cursor()
-        cur.execute("INSERT INTO groups(admin) VALUES(?)", (admin,))
-        gid = cur.lastrowid
-        for m in uniq:
-            cur.execute("INSERT INTO group_members(group_id, member) VALUES(?,?)", (gid, m))
-        conn.commit()
+    with _writing():
+        with _db() as conn:
+            cur = conn.cursor()
+            cur.execute("INSERT INTO groups(admin) VALUES(?)", (admin,))
+            gid = cur.lastrowid
+            for m in uniq:
+                cur.execute("INSERT INTO group_members(group_id, member) VALUES(?,?)", (gid, m))
+            conn.commit()
 
-    # enregistrer en mémoire
-    with lock:
-        groups[gid] = {"admin": admin, "members": set(uniq)}
-        for m in uniq:
-            current_group_by_user[m] = gid
+        # enregistrer en mémoire
+        with lock:
+            groups[gid] = Group(admin, [_uid(m) for m in uniq])
+        history_cache.create(gid)
+    _join_online(gid, uniq)
 
     return gid
 
-def _add_members_to_group(admin: str, new_members: list[str]):
-    """Ajoute des membres au groupe courant de l'admin"""
-    gid = current_group_by_user.get(admin)
-    if gid is None or gid not in groups:
+def _add_members_to_group(admin: str, new_members: list[str], gid: int | None = None):
+    """Ajoute des membres au groupe gid (par défaut le groupe courant) si admin en est l'admin"""
+    if gid is None:
+        gid = _current_gid(admin)
+    g = _get_group(gid) if gid is not None else None
+    if g is None or g.admin != admin:
         return None
 
-    to_add = []
-    with lock:
-        for m in new_members:
-            if m and m not in groups[gid]["members"]:
-                groups[gid]["members"].add(m)
-                to_add.append(m)
+    with _writing():
+        to_add = []
+        with lock:
+            for m in new_members:
+                if m and g.add(_uid(m)):
+                    to_add.append(m)
 
-    if not to_add:
-        return gid
+        if not to_add:
+            return gid
 
-    with sqlite3.connect(DB) as conn:
-        cur = conn.cursor()
-        for m in to_add:
-            cur.execute("INSERT INTO group_members(group_id, member) VALUES(?,?)", (gid, m))
-        conn.commit()
+        with _db() as conn:
+            cur = conn.cursor()
+            for m in to_add:
+                cur.execute("INSERT INTO group_members(group_id, member) VALUES(?,?)", (gid, m))
+            # l'historique antérieur à l'ajout ne compte pas comme non lu
+            cur.executemany("""
+                INSERT OR REPLACE INTO conversations(nom, conv, read_seq)
+                SELECT ?, 'g:' || gid, seq FROM group_stats WHERE gid=?
+            """, [(m, gid) for m in to_add])
+            conn.commit()
 
     # le groupe ajouté devient aussi groupe courant de ces nouveaux membres
-    with lock:
-        for m in to_add:
-            current_group_by_user[m] = gid
+    _join_online(gid, to_add)
 
     return gid
 
@@ -179,238 +741,630 @@ def _notify_group_role(gid: int):
     Format: f"GROUP/{admin}/{gid}/ok/ok" (5 segments)
     Le client regarde parts[1] pour savoir si c’est lui l’admin.
     """
-    with lock:
-        if gid not in groups: return
-        admin = groups[gid]["admin"]
-        members = set(groups[gid]["members"])
+    g = _get_group(gid)
+    if g is None: return
 
-    packet = f"GROUP/{admin}/{gid}/ok/ok"  # len == 5
-    _broadcast_to_names(members, packet)
+    packet = f"GROUP/{g.admin}/{gid}/ok/ok"  # len == 5
+    _broadcast_to_group(gid, packet)
+
+def _read_group_page(gid: int, before: int | None, n: int) -> list[tuple[int, str]]:
+    """n derniers messages (d'id < before) du groupe, base chaude puis archive : [(id, ligne)] croissants"""
+    top = before if before is not None else 1 << 62
+    with _db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT rowid, sender || ': ' || message
+            FROM group_messages
+            WHERE group_id=? AND rowid < ?
+            ORDER BY rowid DESC
+            LIMIT ?
+        """, (gid, top, n))
+        rows = cur.fetchall()[::-1]
+    if len(rows) < n and archive.needs_archive(DB, f"group:{gid}"):
+        # messages archivés : plus anciens que la base chaude, lus seulement jusqu'à remplir la page
+        floor = rows[0][0] if rows else top
+        older = archive.read_group_page(DB, gid, floor, n - len(rows))
+        rows = [(mid, f"{em}: {m}") for mid, em, m, _ in older] + rows
+    return rows
 
-def _send_group_history(to_name: str):
-    """len==4 : renvoie l’historique du groupe courant de l’utilisateur"""
-    gid = current_group_by_user.get(to_name)
-    if gid is None:  # pas de groupe courant
+def _send_group_history(to_name: str, gid: int | None = None, before: int | None = None):
+    """
+    len==4 : page d'historique du groupe gid (par défaut le groupe courant), HISTORY_PAGE messages
+    [[ligne, id], ...] ; before=None : les plus récents (cache mémoire), sinon ceux d'id < before.
+    """
+    if gid is None:
+        gid = _current_gid(to_name)
+    if gid is None or not _is_member(to_name, gid):  # pas de groupe
         payload = json.dumps([])
         packet = f"{payload}/group/historique/tout"
         _send_to_name(to_name, packet)
         return
 
-    with sqlite3.connect(DB) as conn:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT sender || ': ' || message
-            FROM group_messages
-            WHERE group_id=?
-            ORDER BY ts ASC
-        """, (gid,))
-        rows = [r[0] for r in cur.fetchall()]
-    payload = json.dumps([[line] for line in rows])  # [[msg],[msg],...]
-    packet = f"{payload}/group/historique/tout"  # len==4
+    payload = history_cache.page(gid, before, HISTORY_PAGE)
+    if payload is None:
+        if before is None:
+            # défaut sur la fin de l'historique : recharger l'anneau entier depuis la base
+            want = max(HISTORY_PAGE, history_cache.LINES)
+            rows = _read_group_page(gid, None, want)
+            history_cache.fill(gid, rows, complete=len(rows) < want)
+            rows = rows[-HISTORY_PAGE:]
+        else:
+            rows = _read_group_page(gid, before, HISTORY_PAGE)
+        payload = json.dumps([[line, mid] for mid, line in rows])
+    # page plus ancienne : "<gid>@<before>" (le client la place avant ses lignes)
+    packet = f"{payload}/group/historique/{gid}" + ("" if before is None else f"@{before}")
     _send_to_name(to_name, packet)
 
-def _broadcast_group_message(sender: str, text: str):
-    """Diffuser un message au groupe courant du sender + sauver en DB"""
-    gid = current_group_by_user.get(sender)
-    if gid is None:  # pas de groupe courant → ignorer
+def _broadcast_group_message(sender: str, text: str, gid: int | None = None):
+    """Diffuser un message au groupe gid (par défaut le groupe courant du sender) + sauver en DB"""
+    if gid is None:
+        gid = _current_gid(sender)
+    if gid is None or not _is_member(sender, gid):  # pas de groupe → ignorer
         return
-    with lock:
-        members = set(groups.get(gid, {}).get("members", set()))
     msg_line = f"{sender}:{text}"
     # enregistrer
-    with sqlite3.connect(DB) as conn:
+    with _writing():
+        with _db() as conn:
+            cur = conn.cursor()
+            cur.execute("INSERT INTO group_messages(group_id, sender, message, ts) VALUES(?,?,?, strftime('%s','now'))",
+                        (gid, sender, text))
+            mid = cur.lastrowid
+            _bump_group(cur, sender, gid, mid)
+            conn.commit()
+        history_cache.append(gid, mid, f"{sender}: {text}")
+    # diffuser (len==2 pour les messages live groupe : "msg/group" + tag g:<gid>)
+    packet = f"{msg_line}/group{_tag(f'g:{gid}', mid)}"
+    _broadcast_to_group(gid, packet)
+
+def _set_retention(sender: str, raw: str):
+    """politique de rétention d'une conversation (admin du groupe / participant du DM)"""
+    _, conv, hot, keep = raw.split("/")
+    hot_days = float(hot)
+    keep_days = None if keep == "-" else float(keep)
+    kind, _, key = conv.partition(":")
+    if kind == "g":
+        gid = int(key)
+        with _db() as conn:
+            row = conn.execute("SELECT admin FROM groups WHERE id=?", (gid,)).fetchone()
+        if not row or row[0] != sender:
+            return
+        archive.set_policy(DB, "group", str(gid), hot_days, keep_days)
+    elif kind == "d" and key:
+        archive.set_policy(DB, "dm", archive.dm_key(sender, key), hot_days, keep_days)
+
+# ---------- Conversations ----------
+def _bump_dm(cur: sqlite3.Cursor, sender: str, target: str, mid: int):
+    """DM mid inséré : +1 non-lu chez target, dernier message des deux côtés (même transaction)"""
+    cur.executemany("""
+        INSERT INTO conversations(nom, conv, last_id, last_ts, unread)
+        VALUES(?,?,?, strftime('%s','now'), ?)
+        ON CONFLICT(nom, conv) DO UPDATE SET last_id=excluded.last_id, last_ts=excluded.last_ts,
+            unread=unread + excluded.unread
+    """, ((target, f"d:{sender}", mid, 1), (sender, f"d:{target}", mid, 0)))
+
+def _bump_group(cur: sqlite3.Cursor, sender: str, gid: int, mid: int):
+    """message de groupe mid inséré : compteur du groupe +1, déjà lu pour l'émetteur"""
+    cur.execute("""
+        INSERT INTO group_stats(gid, last_id, last_ts, seq) VALUES(?,?, strftime('%s','now'), 1)
+        ON CONFLICT(gid) DO UPDATE SET last_id=excluded.last_id, last_ts=excluded.last_ts, seq=seq + 1
+    """, (gid, mid))
+    cur.execute("""
+        INSERT INTO conversations(nom, conv, read_seq) VALUES(?,?,1)
+        ON CONFLICT(nom, conv) DO UPDATE SET read_seq=read_seq + 1
+    """, (sender, f"g:{gid}"))
+
+def _mark_read(nom: str, conv: str, mid: int):
+    """
+    Accusé de lecture "@read/<conv>/<id>" : lu jusqu'à mid inclus.
+    Cas courant (mid = dernier message) sans lecture de l'historique ; sinon compte
+    les messages plus récents par plage de rowid. Un accusé en retard ne fait pas remonter le compteur.
+    """
+    kind, _, key = conv.partition(":")
+    with _db() as conn:
         cur = conn.cursor()
-        cur.execute("INSERT INTO group_messages(group_id, sender, message, ts) VALUES(?,?,?, strftime('%s','now'))",
-                    (gid, sender, text))
+        if kind == "d" and key:
+            row = cur.execute("SELECT last_id FROM conversations WHERE nom=? AND conv=?", (nom, conv)).fetchone()
+            if row is None:
+                return
+            unread = 0
+            if mid < row[0]:
+                cur.execute("SELECT COUNT(*) FROM messages WHERE rowid > ? AND nomdestination=? AND nomemetteur=?",
+                            (mid, nom, key))
+                unread = cur.fetchone()[0]
+            cur.execute("UPDATE conversations SET unread=MIN(unread, ?) WHERE nom=? AND conv=?", (unread, nom, conv))
+        elif kind == "g" and _is_member(nom, int(key)):
+            gid = int(key)
+            row = cur.execute("SELECT last_id, seq FROM group_stats WHERE gid=?", (gid,)).fetchone()
+            if row is None:
+                return
+            last_id, seq = row
+            if mid < last_id:
+                cur.execute("SELECT COUNT(*) FROM group_messages WHERE rowid > ? AND group_id=?", (mid, gid))
+                seq -= cur.fetchone()[0]
+            cur.execute("""
+                INSERT INTO conversations(nom, conv, read_seq) VALUES(?,?,?)
+                ON CONFLICT(nom, conv) DO UPDATE SET read_seq=MAX(read_seq, excluded.read_seq)
+            """, (nom, conv, seq))
         conn.commit()
-    # diffuser (len==2 pour les messages live groupe : "msg/group")
-    packet = f"{msg_line}/group"
-    _broadcast_to_names(members, packet)
+
+def _send_conversations(nom: str):
+    """
+    "@convs/[[conv, last_id, last_ts, unread], ...]" (plus récente d'abord) : une requête,
+    index (nom, conv) de conversations + group_members.member, quelle que soit la taille de l'historique.
+    """
+    with _db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT conv, last_id, last_ts, unread FROM conversations
+            WHERE nom=? AND conv LIKE 'd:%'
+            UNION ALL
+            SELECT 'g:' || s.gid, s.last_id, s.last_ts, s.seq - COALESCE(c.read_seq, 0)
+            FROM group_members m
+            JOIN group_stats s ON s.gid = m.group_id
+            LEFT JOIN conversations c ON c.nom = m.member AND c.conv = 'g:' || m.group_id
+            WHERE m.member=?
+            ORDER BY 3 DESC
+        """, (nom, nom))
+        rows = cur.fetchall()
+    _send_to_name(nom, "@convs/" + json.dumps(rows))
+
+# ---------- Sessions ----------
+def _drop_sessions(socks: list[socket.socket]):
+    """Retire d'un coup plusieurs sessions (déconnexion, reaper) puis ferme leurs sockets"""
+    dead = set(socks)
+    with lock:
+        for c in dead:
+            s = sessions.pop(c, None)
+            if s is None:
+                continue
+            if by_name.get(s.name) is s:
+                del by_name[s.name]
+            # retirer des index de diffusion (les groupes restent dans le registre)
+            for gid in s.gids:
+                online = group_online.get(gid)
+                if online is not None:
+                    online.discard(c)
+                    if not online:
+                        del group_online[gid]
+    with out_cv:
+        for c in dead:
+            outq.pop(c, None)
+            pending.pop(c, None)
+            dirty.discard(c)
+            wake = writers.pop(c, None)
+            if wake is not None:
+                wake.set()           # écrivain inactif : il se termine
+    for c in dead:
+        try:
+            # shutdown réveille le recv() bloquant du thread de la session
+            c.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            pass
+        try:
+            c.close()
+        except Exception:
+            pass
+
+def _reap_idle_sessions():
+    """@ping aux sessions silencieuses, fermeture groupée de celles qui dépassent IDLE_TIMEOUT"""
+    now = time.monotonic()
+    probe, dead = [], []
+    with lock:
+        for s in sessions.values():
+            idle = now - s.last_seen
+            if idle > IDLE_TIMEOUT:
+                dead.append(s.sock)
+            elif idle > HEARTBEAT_INTERVAL:
+                probe.append(s.sock)
+    if probe:
+        _enqueue(probe, _frame("@ping"))
+    if dead:
+        _drop_sessions(dead)
+
+def reaper_loop():
+    while not _stop.wait(REAP_INTERVAL):
+        try:
+            _reap_idle_sessions()
+        except Exception:
+            pass
 
 # ---------- Handlers ----------
-def handle_client(client: socket.socket):
-    while True:
+def _command_name(raw: str) -> str:
+    """type de paquet (clé des statistiques de profilage), dans l'ordre de _handle_packet"""
+    if raw in ("@ping", "@pong"):
+        return raw[1:]
+    for prefix in ("@g/", "Historique/", "@read/", "@addmembers/"):
+        if raw.startswith(prefix):
+            return prefix.strip("@/").lower()
+    if "!" in raw:
+        return "rename"
+    if raw.endswith("@addgroup"):
+        return "addgroup"
+    if raw.endswith("@addgroup@new"):
+        return "addgroup_new"
+    if raw == "list/new/list":
+        return "list"
+    if raw.startswith("@retention/"):
+        return "retention"
+    if raw == "Historique":
+        return "historique"
+    return "dm" if "/" in raw else "group_text"
+
+def _handle_packet(client: socket.socket, raw: str):
+    # 0) Heartbeat : "@ping" -> "@pong" ; "@pong" ne sert qu'à rafraîchir last_seen
+    if raw == "@ping":
+        _enqueue((client,), _frame("@pong"))
+        return
+    if raw == "@pong":
+        return
+
+    # retrouver la session de l’émetteur
+    with lock:
+        s = sessions.get(client)
+        sender = s.name if s is not None else None
+
+    # 0b) Groupes explicites (avant les formats historiques, le texte peut contenir "!" ou "/")
+    #     "@g/<gid>/<texte>", "Historique/<gid>[/<id>]", "@read/<conv>/<id>", "@addmembers/<gid>/<json>"
+    if raw.startswith("@g/") and sender:
+        _, gid, text = raw.split("/", 2)
+        gid = int(gid)
+        text = text.strip()
+        # le texte brut ne suit que les groupes dont sender est membre
+        if text and _is_member(sender, gid):
+            s.current_gid = gid
+            _broadcast_group_message(sender, text, gid)
+        return
+    if raw.startswith("Historique/") and sender:
+        # "Historique/<gid>" : page récente ; "Historique/<gid>/<id>" : page avant id
+        _, gid, *before = raw.split("/")
+        _send_group_history(sender, int(gid), int(before[0]) if before else None)
+        return
+    if raw.startswith("@read/") and sender:
+        # accusé de lecture : "@read/<g:gid|d:nom>/<id>"
+        _, conv, mid = raw.rsplit("/", 2)
+        _mark_read(sender, conv, int(mid))
+        return
+    if raw.startswith("@addmembers/") and sender:
+        _, gid, json_payload = raw.split("/", 2)
         try:
-            raw = client.recv(1024).decode(ENC)
-            if not raw:
-                raise ConnectionError
+            new_m = json.loads(json_payload)
+        except Exception:
+            new_m = []
+        gid = _add_members_to_group(sender, new_m, int(gid))
+        if gid is not None:
+            _notify_group_role(gid)
+            _broadcast_group_message(sender, f"{', '.join(new_m)} ont été ajoutés", gid)
+        return
 
-            # retrouver le nom de l’émetteur
+    # 1) Changement de nom: "nouveauNom!changerlenom"
+    if "!" in raw and sender:
+        new_name, _ = raw.split("!", 1)
+        with _writing():
+            with _db() as conn:
+                cur = conn.cursor()
+                cur.execute("UPDATE client SET nom=? WHERE nom=?", (new_name, sender))
+                cur.execute("UPDATE messages SET nomemetteur=? WHERE nomemetteur=?", (new_name, sender))
+                cur.execute("UPDATE messages SET nomdestination=? WHERE nomdestination=?", (new_name, sender))
+                cur.execute("UPDATE sessions SET nom=? WHERE nom=?", (new_name, sender))
+                cur.execute("UPDATE group_members SET member=? WHERE member=?", (new_name, sender))
+                cur.execute("UPDATE groups SET admin=? WHERE admin=?", (new_name, sender))
+                cur.execute("UPDATE conversations SET nom=? WHERE nom=?", (new_name, sender))
+                cur.execute("UPDATE conversations SET conv=? WHERE conv=?", (f"d:{new_name}", f"d:{sender}"))
+                cur.execute("INSERT INTO renames(old, new) VALUES(?,?)", (sender, new_name))
+                conn.commit()
             with lock:
-                try:
-                    idx = clients.index(client)
-                    sender = names[idx]
-                except ValueError:
-                    sender = None
-
-            # 1) Changement de nom: "nouveauNom!changerlenom"
-            if "!" in raw and sender:
-                new_name, _ = raw.split("!", 1)
-                with sqlite3.connect(DB) as conn:
-                    cur = conn.cursor()
-                    cur.execute("UPDATE client SET nom=? WHERE nom=?", (new_name, sender))
-                    cur.execute("UPDATE messages SET nomemetteur=? WHERE nomemetteur=?", (new_name, sender))
-                    cur.execute("UPDATE messages SET nomdestination=? WHERE nomdestination=?", (new_name, sender))
-                    conn.commit()
-                with lock:
-                    names[idx] = new_name
-                    # déplacer le groupe courant si existait
-                    if sender in current_group_by_user:
-                        current_group_by_user[new_name] = current_group_by_user.pop(sender)
-                # message d'info visible par le groupe courant (si existe)
-                gid = current_group_by_user.get(new_name)
-                if gid and gid in groups:
-                    _broadcast_group_message(new_name, f"*{sender} → {new_name}*")
-                continue
+                s.name = sys.intern(new_name)
+                if by_name.get(sender) is s:
+                    by_name[s.name] = by_name.pop(sender)
+                # l'id entier suit le nom : les ensembles de membres restent valides
+                if sender in user_ids:
+                    user_ids[s.name] = user_ids.pop(sender)
+                for gid in s.gids:
+                    g = groups.get(gid)
+                    if g is not None and g.admin == sender:
+                        g.admin = s.name
+                _account_rename(sender, s.name)
+        # message d'info visible par le groupe courant (si existe)
+        if s.current_gid:
+            _broadcast_group_message(new_name, f"*{sender} → {new_name}*")
+        return
 
-            # 2) Création groupe: JSON + "@addgroup"
-            if raw.endswith("@addgroup") and sender:
-                json_payload = raw.split("@addgroup")[0]
-                try:
-                    members = json.loads(json_payload)
-                except Exception:
-                    members = [sender]
-                gid = _create_group(sender, members)
-                _notify_group_role(gid)
-                _broadcast_group_message(sender, "groupe créé")
-                continue
+    # 2) Création groupe: JSON + "@addgroup"
+    if raw.endswith("@addgroup") and sender:
+        json_payload = raw.split("@addgroup")[0]
+        try:
+            members = json.loads(json_payload)
+        except Exception:
+            members = [sender]
+        gid = _create_group(sender, members)
+        _notify_group_role(gid)
+        _broadcast_group_message(sender, "groupe créé")
+        return
 
-            # 3) Ajout membres: JSON + "@addgroup@new"
-            if raw.endswith("@addgroup@new") and sender:
-                json_payload = raw.split("@addgroup@new")[0]
-                try:
-                    new_m = json.loads(json_payload)
-                except Exception:
-                    new_m = []
-                gid = _add_members_to_group(sender, new_m)
-                if gid is not None:
-                    _notify_group_role(gid)
-                    _broadcast_group_message(sender, f"{', '.join(new_m)} ont été ajoutés")
-                continue
+    # 3) Ajout membres: JSON + "@addgroup@new"
+    if raw.endswith("@addgroup@new") and sender:
+        json_payload = raw.split("@addgroup@new")[0]
+        try:
+            new_m = json.loads(json_payload)
+        except Exception:
+            new_m = []
+        gid = _add_members_to_group(sender, new_m)
+        if gid is not None:
+            _notify_group_role(gid)
+            _broadcast_group_message(sender, f"{', '.join(new_m)} ont été ajoutés")
+        return
 
-            # 4) Demande de liste utilisateurs: "list/new/list"
-            if raw == "list/new/list" and sender:
-                _send_user_list(sender)
-                continue
+    # 4) Demande de liste utilisateurs: "list/new/list"
+    if raw == "list/new/list" and sender:
+        _send_user_list(sender)
+        return
 
-            # 5) Historique groupe
-            if raw == "Historique" and sender:
-                _send_group_history(sender)
-                continue
+    # 4b) Rétention: "@retention/<g:gid|d:nom>/<hot_days>/<keep_days|->"
+    if raw.startswith("@retention/") and sender:
+        _set_retention(sender, raw)
+        return
 
-            # 6) DM : "message/cible"
-            if "/" in raw:
-                parts = raw.split("/")
-                if len(parts) == 2 and sender:
-                    msg, target = parts
-                    msg = msg.strip()
-                    target = target.strip()
-                    if msg:
-                        with sqlite3.connect(DB) as conn:
-                            cur = conn.cursor()
-                            cur.execute(
-                                "INSERT INTO messages(nomemetteur,nomdestination,message,ts) VALUES(?,?,?, strftime('%s','now'))",
-                                (sender, target, msg)
-                            )
-                            conn.commit()
-                        _send_to_name(target, f"{sender}:{msg}\n")
-                continue
+    # 5) Historique groupe
+    if raw == "Historique" and sender:
+        _send_group_history(sender)
+        return
+
+    # 6) DM : "message/cible"
+    if "/" in raw:
+        parts = raw.split("/")
+        if len(parts) == 2 and sender:
+            msg, target = parts
+            msg = msg.strip()
+            target = target.strip()
+            if msg:
+                with _db() as conn:
+                    cur = conn.cursor()
+                    cur.execute(
+                        "INSERT INTO messages(nomemetteur,nomdestination,message,ts) VALUES(?,?,?, strftime('%s','now'))",
+                        (sender, target, msg)
+                    )
+                    mid = cur.lastrowid
+                    _bump_dm(cur, sender, target, mid)
+                    conn.commit()
+                _send_to_name(target, f"{sender}:{msg}{_tag(f'd:{sender}', mid)}")
+        return
 
-            # 7) Message de groupe : texte brut
-            if sender:
-                text = raw.strip()
-                if text:
-                    _broadcast_group_message(sender, text)
+    # 7) Message de groupe : texte brut
+    if sender:
+        text = raw.strip()
+        if text:
+            _broadcast_group_message(sender, text)
 
-        except ConnectionError:
-            # cleanup
+def handle_client(client: socket.socket, buf: bytearray):
+    s = sessions.get(client)
+    if s is None:
+        return                  # déjà retirée (reaper / arrêt) avant le démarrage du thread
+    while True:
+        try:
+            packets = _recv_packets(client, buf)
+        except OSError:
+            # déconnexion (ou socket fermée par le reaper) -> cleanup
+            if capture.ACTIVE:
+                capture.record(client, "close", "")
+            _drop_sessions([client])
+            break
+        s.last_seen = time.monotonic()
+        for raw in packets:
+            if not raw:
+                continue
+            if capture.ACTIVE:
+                capture.record(client, _command_name(raw), raw)
             try:
-                with lock:
-                    if client in clients:
-                        i = clients.index(client)
-                        dead_name = names[i]
-                        clients.pop(i)
-                        names.pop(i)
-                        # retirer des groupes en mémoire
-                        for gid, g in list(groups.items()):
-                            if dead_name in g["members"]:
-                                g["members"].discard(dead_name)
-                        current_group_by_user.pop(dead_name, None)
-                client.close()
+                if profiling.ENABLED:
+                    profiling.run(_command_name(raw), _handle_packet, client, raw)
+                else:
+                    _handle_packet(client, raw)
             except Exception:
-                pass
-            break
-        except Exception:
-            # ignorer erreurs transitoires
-            continue
+                # ignorer erreurs transitoires
+                continue
 
 # ---------- Auth ----------
 def _send_connected_banner(to_name: str):
     _send_to_name(to_name, "You are connected!\n")
-    # Rejouer quelques DM en retard (tri par ts)
-    with sqlite3.connect(DB) as conn:
+    # Rejouer quelques DM en retard (tri par ts), archive comprise
+    rows = []
+    if archive.needs_archive(DB, "dm"):
+        rows = [(mid, em, m) for mid, em, m, _ in archive.read_dms(DB, to_name)]
+    with _db() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT nomemetteur, message FROM messages WHERE nomdestination=? ORDER BY ts ASC", (to_name,))
-        for em, m in cur.fetchall():
-            _send_to_name(to_name, f"{em}:{m}\n")
+        cur.execute("SELECT rowid, nomemetteur, message FROM messages WHERE nomdestination=? ORDER BY ts ASC", (to_name,))
+        rows += cur.fetchall()
+    for mid, em, m in rows:
+        _send_to_name(to_name, f"{em}:{m}{_tag(f'd:{em}', mid)}")
 
-def _handle_signup(client: socket.socket, payload: str):
+def _issue_session(nom: str) -> str:
+    """
+    Crée un jeton de reprise (persisté : survit à un redémarrage du serveur).
+    Envoie au client f"@session/{token}/{dm_max}/{grp_max}" : les ids max au moment
+    du login servent de plancher pour les conversations pas encore vues.
+    """
+    token = secrets.token_urlsafe(24)
+    now = time.time()
+    with _db() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM sessions WHERE expires < ?", (now,))
+        cur.execute("INSERT INTO sessions(token, nom, expires) VALUES(?,?,?)", (token, nom, now + SESSION_TTL))
+        cur.execute("SELECT COALESCE(MAX(rowid), 0) FROM messages")
+        dm_max = cur.fetchone()[0]
+        cur.execute("SELECT COALESCE(MAX(rowid), 0) FROM group_messages")
+        grp_max = cur.fetchone()[0]
+        conn.commit()
+    _send_to_name(nom, f"@session/{token}/{dm_max}/{grp_max}")
+    return token
+
+def _add_session(client: socket.socket, nom: str) -> Session:
+    s = Session(client, nom)
+    with lock:
+        sessions[client] = s
+        by_name[s.name] = s
+    return s
+
+def _register_session(client: socket.socket, nom: str, buf: bytearray, banner: bool = True) -> list[int]:
+    """connecte la session authentifiée, charge ses groupes et démarre son thread de lecture"""
+    s = _add_session(client, nom)
+    if capture.ACTIVE:
+        capture.record(client, "login", nom)
+    mine = _load_user_groups(s)
+    if banner:
+        _issue_session(nom)
+        _send_connected_banner(nom)
+        # après le rejeu des DM : en reprise, le client tient déjà ses compteurs
+        _send_conversations(nom)
+    # "@groups/[[gid, admin], ...]" : liste des groupes pour le sélecteur du client
+    _send_to_name(nom, "@groups/" + json.dumps(mine))
+    threading.Thread(target=handle_client, args=(client, buf), daemon=True).start()
+    return [gid for gid, _ in mine]
+
+def _follow_renames(cur: sqlite3.Cursor, seen: dict) -> dict:
+    """
+    seen du client avec les DM des correspondants renommés depuis reportés sur leur nouveau
+    nom (les messages en base portent déjà le nouveau nom) ; suit les renommages en chaîne.
+    """
+    if not any(k.startswith("d:") for k in seen):
+        return seen
+    seen = dict(seen)
+    cur.execute("SELECT old, new FROM renames ORDER BY id")
+    for old, new in cur.fetchall():
+        mid = seen.get(f"d:{old}")
+        if mid is not None:
+            seen[f"d:{new}"] = max(int(seen.get(f"d:{new}", 0)), int(mid))
+    return seen
+
+def _replay_since(nom: str, gids: list[int], seen: dict, floor: dict):
+    """
+    Renvoie uniquement les messages postérieurs au dernier id vu par conversation.
+    Seuil d'une conversation = max(dernier id vu, plancher du login) : tout ce qui est
+    sous le plancher a déjà été reçu (rejeu DM du login / messages live).
+    """
+    dm_floor = int(floor.get("d", 0))
+    grp_floor = int(floor.get("g", 0))
+    with _db() as conn:
+        cur = conn.cursor()
+        seen = _follow_renames(cur, seen)
+        cur.execute("""
+            SELECT rowid, nomemetteur, message FROM messages
+            WHERE rowid > ? AND nomdestination=?
+            ORDER BY rowid ASC
+        """, (dm_floor, nom))
+        dms = cur.fetchall()
+        rows = []
+        if gids:
+            marks = ",".join("?" * len(gids))
+            cur.execute(f"""
+                SELECT rowid, group_id, sender, message FROM group_messages
+                WHERE rowid > ? AND group_id IN ({marks})
+                ORDER BY rowid ASC
+            """, (grp_floor, *gids))
+            rows = cur.fetchall()
+    # absent depuis plus longtemps que la rétention "hot" : relire aussi l'archive
+    if archive.needs_archive(DB, "dm", dm_floor):
+        dms = [(mid, em, m) for mid, em, m, _ in archive.read_dms(DB, nom, dm_floor)] + dms
+    if archive.needs_archive(DB, "group", grp_floor):
+        rows = [(mid, gid, em, m) for gid in gids if archive.needs_archive(DB, f"group:{gid}", grp_floor)
+                for mid, em, m, _ in archive.read_group(DB, gid, grp_floor)] + rows
+    for mid, em, m in dms:
+        if mid > int(seen.get(f"d:{em}", 0)):
+            _send_to_name(nom, f"{em}:{m}{_tag(f'd:{em}', mid)}")
+    for mid, gid, em, m in rows:
+        if mid > int(seen.get(f"g:{gid}", 0)):
+            _send_to_name(nom, f"{em}:{m}/group{_tag(f'g:{gid}', mid)}")
+
+def _ids(d) -> dict:
+    """{clé str: id entier} d'un état client ; entrées mal formées ignorées"""
+    if not isinstance(d, dict):
+        return {}
+    return {k: v for k, v in d.items() if isinstance(k, str) and type(v) is int and v >= 0}
+
+def _resume_state(raw: str) -> dict:
+    """état de reprise envoyé par le client (current, seen, floor), réduit à sa forme attendue"""
+    try:
+        state = json.loads(raw)
+    except ValueError:
+        state = None
+    if not isinstance(state, dict):
+        state = {}
+    current = state.get("current")
+    return {"current": current if type(current) is int else None,
+            "seen": _ids(state.get("seen")), "floor": _ids(state.get("floor"))}
+
+def _handle_resume(client: socket.socket, payload: str, buf: bytearray):
+    # payload: "@resume/token/{json: current, seen, floor}"
+    parts = payload.split("/", 2)
+    token = parts[1] if len(parts) > 1 else ""
+    state = _resume_state(parts[2] if len(parts) > 2 else "{}")
+    now = time.time()
+    with _db() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT nom FROM sessions WHERE token=? AND expires >= ?", (token, now))
+        row = cur.fetchone()
+        if row:
+            cur.execute("UPDATE sessions SET expires=? WHERE token=?", (now + SESSION_TTL, token))
+            conn.commit()
+    if not row:
+        try:
+            client.send(_frame("@resume/fail"))
+            client.close()
+        except Exception:
+            pass
+        return
+    nom = row[0]
+    client.send(_frame("@resumed"))
+    gids = _register_session(client, nom, buf, banner=False)
+    if state["current"] in gids:
+        with lock:
+            s = by_name.get(nom)
+            if s is not None:
+                s.current_gid = state["current"]
+    _replay_since(nom, gids, state["seen"], state["floor"])
+
+def _handle_signup(client: socket.socket, payload: str, buf: bytearray):
     # payload: "nom/password/email/passwordConfirm"
     parts = payload.split("/")
     if len(parts) != 4:
         client.detach(); return
     nom, password, email, password2 = parts
-    with sqlite3.connect(DB) as conn:
+    with _db() as conn:
         cur = conn.cursor()
         cur.execute("SELECT 1 FROM client WHERE nom=?", (nom,))
         exists = cur.fetchone() is not None
         # renvoyer la liste des noms (compat client)
-        cur.execute("SELECT DISTINCT nom FROM client")
-        alln = [r[0] for r in cur.fetchall()]
-        reply = " " + "".join(f"/{n}" for n in alln)
-        client.send(reply.encode(ENC))
+        client.send(_frame(_accounts_line()))
         if exists or password != password2:
             client.detach()
             return
         # créer
-        cur.execute("INSERT INTO client(nom,password,email) VALUES(?,?,?)", (nom, password, email))
-        conn.commit()
+        with _writing():
+            cur.execute("INSERT INTO client(nom,password,email) VALUES(?,?,?)", (nom, password, email))
+            conn.commit()
+            with lock:
+                _account_add(nom)
 
     # connecter
-    with lock:
-        clients.append(client)
-        names.append(nom)
-    _send_connected_banner(nom)
-
-    threading.Thread(target=handle_client, args=(client,), daemon=True).start()
+    _register_session(client, nom, buf)
 
-def _handle_signin(client: socket.socket, payload: str):
+def _handle_signin(client: socket.socket, payload: str, buf: bytearray):
     # payload: "nom/password"
     parts = payload.split("/")
     if len(parts) != 2:
         client.detach(); return
     nom, password = parts
-    with sqlite3.connect(DB) as conn:
+    with _db() as conn:
         cur = conn.cursor()
         # renvoyer la liste des noms (compat client)
-        cur.execute("SELECT DISTINCT nom FROM client")
-        alln = [r[0] for r in cur.fetchall()]
-        reply = " " + "".join(f"/{n}" for n in alln)
-        client.send(reply.encode(ENC))
-
-        if nom in alln:
-            cur.execute("SELECT password FROM client WHERE nom=?", (nom,))
-            row = cur.fetchone()
-            if not row:
-                client.detach(); return
+        client.send(_frame(_accounts_line()))
+
+        cur.execute("SELECT password FROM client WHERE nom=?", (nom,))
+        row = cur.fetchone()
+        if row:
             real_pass = row[0]
-            client.send(real_pass.encode(ENC))
+            client.send(_frame(real_pass))
             if password == real_pass:
-                with lock:
-                    clients.append(client)
-                    names.append(nom)
-                _send_connected_banner(nom)
-                threading.Thread(target=handle_client, args=(client,), daemon=True).start()
+                _register_session(client, nom, buf)
             else:
                 try:
                     client.detach()
@@ -422,14 +1376,232 @@ def _handle_signin(client: socket.socket, payload: str):
             except Exception:
                 pass
 
+# ---------- Fichiers ----------
+BLOB_DIR = "blobs"
+
+def _session_user(token: str):
+    """nom associé à un jeton de session valide (auth du serveur de fichiers)"""
+    with _db() as conn:
+        row = conn.execute("SELECT nom FROM sessions WHERE token=? AND expires >= ?",
+                           (token, time.time())).fetchone()
+    return row[0] if row else None
+
 # ---------- Accept loop ----------
+def _accept_session(client: socket.socket):
+    """handshake TLS + premier paquet (auth) dans le thread de la connexion, jamais dans l'accept"""
+    buf = bytearray()
+    try:
+        # un client muet ne doit pas bloquer sa connexion indéfiniment
+        client.settimeout(IDLE_TIMEOUT)
+        if tls_ctx is not None:
+            client = tls_ctx.wrap_socket(client, server_side=True)
+        first, *rest = _recv_packets(client, buf)
+        client.settimeout(None)
+        # paquets envoyés dans la foulée de l'auth : rendus à buf, lus par handle_client
+        buf[:0] = b"".join(_frame(raw) for raw in rest)
+    except (OSError, ssl.SSLError):
+        client.close()
+        return
+    if first.startswith("@resume/"):
+        command, handler = "resume", _handle_resume
+    elif first.count("/") == 3:
+        command, handler = "signup", _handle_signup
+    else:
+        command, handler = "signin", _handle_signin
+    if profiling.ENABLED:
+        profiling.run(command, handler, client, first, buf)
+    else:
+        handler(client, first, buf)
+
 def accept_loop():
     while True:
-        client, addr = server.accept()
-        first = client.recv(1024).decode(ENC)
-        if first.count("/") == 3:
-            _handle_signup(client, first)
-        else:
-            _handle_signin(client, first)
+        try:
+            client, addr = server.accept()
+        except OSError:
+            # socket d'écoute fermée par ChatServer.stop()
+            return
+        # la coalescence se fait dans le flusher : pas de délai de Nagle en plus
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        threading.Thread(target=_accept_session, args=(client,), daemon=True).start()
+
+# ---------- Profilage ----------
+def set_profiling(on: bool):
+    """bascule à chaud (voir profiling.py) : le verrou global est enveloppé / rendu"""
+    global lock
+    if on and not profiling.ENABLED:
+        lock = profiling.ProfiledLock(lock)
+        profiling.enable()
+    elif not on and profiling.ENABLED:
+        profiling.disable()
+        lock = lock.inner
+
+def dump_profile(directory: str | None = None) -> str:
+    with lock:
+        n = len(sessions)
+    directory = profiling.dump(directory, n)
+    with open(os.path.join(directory, "history_cache.json"), "w", encoding="utf-8") as f:
+        json.dump(history_cache.stats(), f, indent=1)
+    return directory
+
+# ---------- Serveur ----------
+def _reset_state():
+    """état de routage vierge (redémarrage dans le même processus)"""
+    global _next_uid, _accounts_ready, _accounts_reply
+    with lock:
+        for d in (sessions, by_name, groups, group_online, user_ids, accounts):
+            d.clear()
+        _next_uid = 1
+        _accounts_ready = False
+        _accounts_reply = None
+    with out_cv:
+        outq.clear()
+        pending.clear()
+        dirty.clear()
+        for wake in writers.values():
+            wake.set()
+        writers.clear()
+    history_cache.drop()
+
+def _memory_uri(name: str) -> str:
+    """base en mémoire partagée entre les connexions du processus"""
+    if sqlite3.sqlite_version_info >= (3, 36):
+        return f"file:/{name}?vfs=memdb"        # verrous normaux (busy timeout)
+    return f"file:{name}?mode=memory&cache=shared"
+
+class ChatServer:
+    """
+    Serveur démarrable / arrêtable depuis un autre programme (tests, benchs) :
+
+        srv = ChatServer("127.0.0.1", 0, ":memory:").start()   # port éphémère -> srv.port
+        ...
+        srv.stop()                                             # vide les files puis ferme
+
+    db=":memory:" : base en mémoire, gardée en vie par une connexion jusqu'au stop().
+    L'état de routage est celui du module : une seule instance démarrée à la fois par processus
+    (start() lève RuntimeError tant que la précédente n'est pas arrêtée).
+    """
+    def __init__(self, host: str | None = SERVER_IP, port: int = SERVER_PORT, db: str = DB,
+                 ssl_context: ssl.SSLContext | None = None, file_port: int | None = None,
+                 blob_dir: str = BLOB_DIR, archive_interval: float | None = ARCHIVE_INTERVAL,
+                 snapshot_interval: float | None = SNAPSHOT_INTERVAL):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.ssl_context = ssl_context
+        # par défaut port + 1 ; éphémère lui aussi si port == 0
+        self.file_port = file_port if file_port is not None else (port + 1 if port else 0)
+        self.blob_dir = blob_dir
+        self.archive_interval = archive_interval
+        self.snapshot_interval = snapshot_interval
+        self.warm = False            # état rechargé depuis un instantané au démarrage
+        self.files = None
+        self._keeper = None
+        self._threads = []
+
+    def start(self) -> "ChatServer":
+        global DB, server, tls_ctx, _running
+        if _running is not None:
+            raise RuntimeError("un ChatServer est déjà démarré dans ce processus : stop() d'abord")
+        if self.host is None:
+            self.host = socket.gethostbyname(socket.gethostname())
+        db = self.db
+        if db == ":memory:":
+            db = _memory_uri(f"instachat-{secrets.token_hex(4)}")
+            self._keeper = sqlite3.connect(db, uri=True)
+            self.archive_interval = None     # pas de partitions d'archive pour une base en mémoire
+            self.snapshot_interval = None    # ni d'instantané
+        DB = db
+        tls_ctx = self.ssl_context
+        _stop.clear()
+        _reset_state()
+        prepare_db()
+        self.warm = bool(self.snapshot_interval) and load_snapshot()
+
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((self.host, self.port))
+        server.listen()
+        self.port = server.getsockname()[1]
+        self.files = filestore.FileServer(self.host, self.file_port, self.blob_dir,
+                                          auth=_session_user, ssl_context=tls_ctx)
+        self.file_port = self.files.port
+        self.files.start()
+
+        loops = [(flusher_loop, ()), (reaper_loop, ()), (accept_loop, ())]
+        if self.archive_interval:
+            loops.append((archiver_loop, (self.archive_interval,)))
+        if self.snapshot_interval:
+            loops.append((snapshot_loop, (self.snapshot_interval,)))
+        self._threads = [threading.Thread(target=f, args=a, daemon=True) for f, a in loops]
+        for t in self._threads:
+            t.start()
+        _running = self
+        return self
+
+    def stop(self, drain: float = 2.0):
+        """n'accepte plus rien, laisse le flusher vider les files (drain s max), puis ferme tout"""
+        global _running
+        if _running is not self:
+            return
+        try:
+            # shutdown réveille accept() (un simple close ne suffit pas sous Linux)
+            server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        server.close()
+        self.files.stop()
+        end = time.monotonic() + drain
+        with out_cv:
+            while any(outq.values()) and time.monotonic() < end:
+                out_cv.wait(0.01)
+        with lock:
+            live = list(sessions)
+        _drop_sessions(live)
+        _stop.set()
+        with out_cv:
+            out_cv.notify_all()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        if self.snapshot_interval:
+            save_snapshot(wait=drain)
+        if self._keeper is not None:
+            self._keeper.close()
+            self._keeper = None
+        capture.stop()
+        _running = None
+
+    def serve_forever(self):
+        if THREAD_STACK:
+            # un thread par session : pile choisie explicitement (voir THREAD_STACK)
+            threading.stack_size(THREAD_STACK)
+        self.start()
+        print("listening on", self.host, self.port)
+        if self.warm:
+            print("état rechargé depuis l'instantané", _db_file() + ".snap")
+        # kill -USR1 <pid> : profilage on/off ; kill -USR2 <pid> : dump dans profiles/
+        profiling.install_signals(lambda: set_profiling(not profiling.ENABLED),
+                                  lambda: print("profil écrit dans", dump_profile()))
+        # Ctrl-C ou SIGTERM : arrêt propre (files vidées, capture fermée)
+        stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+        try:
+            while not stopping.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            pass
+        self.stop()
 
-accept_loop()
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default=SERVER_IP)
+    ap.add_argument("--port", type=int, default=SERVER_PORT)
+    ap.add_argument("--db", default=DB, help='chemin SQLite ou ":memory:"')
+    ap.add_argument("--capture", help="enregistre le trafic entrant dans ce fichier (voir replay.py)")
+    ap.add_argument("--capture-payloads", default="anon", choices=capture.MODES)
+    args = ap.parse_args()
+    if args.capture:
+        capture.start(args.capture, args.capture_payloads)
+    ctx = tls.server_context(TLS_CERT, TLS_KEY) if TLS_CERT and TLS_KEY else None
+    ChatServer(args.host, args.port, args.db, ssl_context=ctx).serve_forever()
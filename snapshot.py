@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Instantané de l'état mémoire du serveur pour un redémarrage à chaud.
+
+Fichier : en-tête HEADER (magic, version, compteur de changements SQLite, version de schéma,
+taille, date) puis l'état sérialisé avec marshal (dicts / listes / str / int / bytes).
+Validité : le compteur de changements de l'en-tête SQLite (octets 24-27, big-endian) avance
+à chaque transaction d'écriture ; un instantané n'est rechargé que si la base n'a pas été
+modifiée depuis, sinon le serveur repart vide et reconstruit à la demande.
+En journal_mode=WAL ce compteur n'avance pas à chaque commit : une base en WAL (octets 18-19
+de l'en-tête à 2) n'a pas de compteur utilisable, aucun instantané n'est écrit ni rechargé.
+Lecture par mmap : le contrôle de validité ne lit que l'en-tête, quelle que soit la taille.
+"""
+import marshal
+import mmap
+import os
+import struct
+import time
+
+MAGIC = b"ISNP"
+VERSION = 1
+HEADER = struct.Struct("<4sBIIQd")       # magic, version, compteur, schéma, taille de l'état, date
+SQLITE_MAGIC = b"SQLite format 3\x00"
+_COUNTER = struct.Struct(">I")           # en-tête SQLite, offset 24
+_WAL = 2                                 # versions d'écriture / lecture (offsets 18, 19) en mode WAL
+
+def change_counter(db_path: str) -> int | None:
+    """compteur de changements du fichier SQLite (None : pas de fichier / pas une base / base en WAL)"""
+    try:
+        with open(db_path, "rb") as f:
+            head = f.read(28)
+    except OSError:
+        return None
+    if len(head) < 28 or not head.startswith(SQLITE_MAGIC):
+        return None
+    if _WAL in (head[18], head[19]):
+        return None
+    return _COUNTER.unpack_from(head, 24)[0]
+
+def write(path: str, counter: int, schema: int, state: dict) -> int:
+    """écrit l'instantané (fichier temporaire puis remplacement atomique) ; renvoie sa taille"""
+    payload = marshal.dumps(state)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, counter, schema, len(payload), time.time()))
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return HEADER.size + len(payload)
+
+def load(path: str, counter: int | None, schema: int) -> dict | None:
+    """état de l'instantané, ou None s'il est absent, illisible ou périmé (base modifiée depuis)"""
+    if counter is None:
+        return None
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return None
+    with f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None          # fichier vide
+    with mm:
+        if len(mm) < HEADER.size:
+            return None
+        magic, version, snap_counter, snap_schema, size, _ = HEADER.unpack_from(mm, 0)
+        if (magic, version, snap_counter, snap_schema) != (MAGIC, VERSION, counter, schema):
+            return None
+        if HEADER.size + size > len(mm):
+            return None          # écriture interrompue
+        view = memoryview(mm)[HEADER.size:HEADER.size + size]
+        try:
+            state = marshal.loads(view)
+        except (EOFError, ValueError, TypeError):
+            return None
+        finally:
+            view.release()
+    return state if isinstance(state, dict) else None
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Pagination de l'historique de groupe : page récente à l'ouverture du groupe,
+puis bouton "Plus anciens" jusqu'à l'événement "older".
+
+    python -m pytest -q test_history_paging.py
+"""
+import importlib.util
+import tempfile
+import threading
+import types
+import unittest
+
+import server
+from chat_core import ChatSession
+
+MESSAGES = 12
+PAGE = 5
+
+
+class _Frame:
+    """ChatFrame réduit à ce que ModernChatApp appelle pour un groupe"""
+
+    def __init__(self):
+        self.lines = []
+
+    def set_group_lines(self, lines):
+        self.lines = list(lines)
+
+    def prepend_group(self, lines):
+        self.lines[:0] = lines
+
+    def append_group(self, line):
+        self.lines.append(line)
+
+    def append_global(self, text):
+        pass
+
+
+class HistoryPagingTest(unittest.TestCase):
+    def setUp(self):
+        self._page = server.HISTORY_PAGE
+        server.HISTORY_PAGE = PAGE
+        self.srv = server.ChatServer("127.0.0.1", 0, ":memory:", blob_dir=tempfile.mkdtemp()).start()
+        self.events = []
+        self.cv = threading.Condition()
+        self.forward = None
+        self.session = ChatSession("127.0.0.1", self.srv.port, file_port=self.srv.file_port,
+                                   on_event=self._on_event)
+        self.assertEqual(self.session.signup("alice", "a@x", "pw", "pw"), "ok")
+        self.session.start()
+        self.session.create_group(["alice"])
+        self._wait(lambda: self.session.groups)
+        self.gid = max(self.session.groups)
+        for i in range(MESSAGES):
+            self.session.send_group(f"m{i}")
+        self._wait(lambda: sum(e[0] == "group_line" for e in self.events) >= MESSAGES)
+        # état d'un client qui vient de se connecter : rien reçu de l'historique
+        self.session.group_lines.pop(self.gid, None)
+        self.events.clear()
+
+    def tearDown(self):
+        self.session.stop(close=True)
+        self.srv.stop()
+        server.HISTORY_PAGE = self._page
+
+    def _on_event(self, *event):
+        with self.cv:
+            self.events.append(event)
+            self.cv.notify_all()
+        if self.forward:
+            self.forward(*event)
+
+    def _wait(self, cond):
+        with self.cv:
+            self.assertTrue(self.cv.wait_for(cond, timeout=5))
+
+    def _event(self, kind):
+        self._wait(lambda: any(e[0] == kind for e in self.events))
+        return next(e for e in self.events if e[0] == kind)
+
+    def test_open_group_arms_request_older(self):
+        self.assertFalse(self.session.request_older(self.gid))
+        self.session.open_group(self.gid)
+        _, gid, lines = self._event("history")
+        self.assertEqual(gid, self.gid)
+        self.assertEqual(lines, [f"alice: m{i}" for i in range(MESSAGES - PAGE, MESSAGES)])
+        self.assertTrue(self.session.request_older(self.gid))
+        _, gid, lines = self._event("older")
+        self.assertEqual(lines, [f"alice: m{i}" for i in range(MESSAGES - 2 * PAGE, MESSAGES - PAGE)])
+        # deuxième ouverture : pas de nouvelle page récente
+        self.session.open_group(self.gid)
+        self.assertEqual(self.session.group_lines[self.gid][0], f"alice: m{MESSAGES - 2 * PAGE}")
+
+    @unittest.skipUnless(importlib.util.find_spec("customtkinter"), "customtkinter absent")
+    def test_gui_button_reaches_older(self):
+        from client_gui import ModernChatApp
+        frame = _Frame()
+        app = types.SimpleNamespace(session=self.session, chat_frame=frame, refresh_groups=lambda: None)
+        for name in ("show_group", "on_event", "request_older", "on_group_line"):
+            setattr(app, name, getattr(ModernChatApp, name).__get__(app))
+        self.forward = app.on_event
+        app.show_group(self.gid)
+        self._event("history")
+        app.request_older()
+        self._event("older")
+        self.assertEqual(frame.lines, [f"alice: m{i}" for i in range(MESSAGES - 2 * PAGE, MESSAGES)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+TLS optionnel pour le chat et le serveur de fichiers.
+
+Reprise de session : le serveur émet des tickets TLS 1.3 (num_tickets) ; le client garde
+la session (ChatClient.tls_session) et la représente à la reconnexion -> handshake abrégé.
+make_test_ca() fabrique une CA locale + un certificat serveur (outil `openssl`) pour
+les essais et bench_tls.py ; ne pas l'utiliser en production.
+"""
+import os
+import shutil
+import ssl
+import subprocess
+
+TICKETS = 2                  # tickets de session émis par handshake (TLS 1.3)
+
+def server_context(certfile: str, keyfile: str) -> ssl.SSLContext:
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.minimum_version = ssl.TLSVersion.TLSv1_2
+    ctx.load_cert_chain(certfile, keyfile)
+    ctx.num_tickets = TICKETS
+    return ctx
+
+def client_context(cafile: str | None = None) -> ssl.SSLContext:
+    """cafile : CA à faire confiance (ex. la CA de test) ; None = magasin du système"""
+    ctx = ssl.create_default_context(cafile=cafile)
+    ctx.minimum_version = ssl.TLSVersion.TLSv1_2
+    return ctx
+
+def make_test_ca(directory: str, hosts=("localhost", "127.0.0.1")) -> dict:
+    """
+    CA de test + certificat serveur signé pour hosts (noms DNS ou IP).
+    Retourne {"ca": ..., "cert": ..., "key": ...} (chemins PEM).
+    """
+    openssl = shutil.which("openssl")
+    if openssl is None:
+        raise RuntimeError("outil openssl introuvable")
+    os.makedirs(directory, exist_ok=True)
+    p = {k: os.path.join(directory, f) for k, f in (
+        ("ca", "ca.pem"), ("ca_key", "ca.key"), ("cert", "server.pem"),
+        ("key", "server.key"), ("csr", "server.csr"), ("ext", "server.ext"))}
+    san = ",".join(("IP:" if h.replace(".", "").isdigit() else "DNS:") + h for h in hosts)
+    with open(p["ext"], "w") as f:
+        f.write(f"subjectAltName={san}\nbasicConstraints=CA:FALSE\nkeyUsage=digitalSignature,keyEncipherment\n")
+
+    def run(*args):
+        subprocess.run([openssl, *args], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    run("req", "-x509", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1", "-nodes",
+        "-keyout", p["ca_key"], "-out", p["ca"], "-days", "30", "-subj", "/CN=InstaChat Test CA")
+    run("req", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1", "-nodes",
+        "-keyout", p["key"], "-out", p["csr"], "-subj", f"/CN={hosts[0]}")
+    run("x509", "-req", "-in", p["csr"], "-CA", p["ca"], "-CAkey", p["ca_key"], "-CAcreateserial",
+        "-out", p["cert"], "-days", "30", "-extfile", p["ext"])
+    return {"ca": p["ca"], "cert": p["cert"], "key": p["key"]}